@@ -0,0 +1,85 @@
+"""Driver call overhead benchmark
+
+Measures the Python overhead of the driver calls made on each poll, i.e. a
+readiness check and a fetch of times and values, with and without the
+prototypes and cached buffer references of :mod:`datalog.adc.hrdl.bindings`.
+
+The PicoLog library and unit are not needed: C library functions taking
+similar arguments stand in for the driver functions, and do no work, so the
+timings are dominated by argument conversion and the foreign function call.
+
+Sean Leavey
+https://github.com/SeanDS/
+"""
+
+import time
+import ctypes
+import ctypes.util
+
+from datalog.adc.hrdl.bindings import declare_prototypes
+
+# number of polls to time
+POLLS = 200000
+
+# number of times to repeat each timing
+REPEATS = 5
+
+# samples in the buffers
+SAMPLE_BUF_LEN = 100000
+
+# stand-ins for HRDLReady and HRDLGetTimesAndValues
+PROTOTYPES = {
+    "abs": (ctypes.c_int16, [ctypes.c_int16]),
+    "memcmp": (ctypes.c_int32, [ctypes.c_void_p, ctypes.c_void_p,
+                                ctypes.c_size_t])
+}
+
+LIB_PATH = ctypes.util.find_library("c")
+
+# separate library instances, so that only one has declared prototypes
+plain_lib = ctypes.CDLL(LIB_PATH)
+prototyped_lib = declare_prototypes(ctypes.CDLL(LIB_PATH), PROTOTYPES)
+
+handle = 1
+sample_times = (ctypes.c_int32 * SAMPLE_BUF_LEN)()
+sample_values = (ctypes.c_int32 * SAMPLE_BUF_LEN)()
+
+# cached references and sample count
+p_sample_times = ctypes.byref(sample_times)
+p_sample_values = ctypes.byref(sample_values)
+c_num_samples = ctypes.c_size_t(0)
+
+
+def poll_plain():
+    """Polls with arguments wrapped on each call and no prototypes"""
+    plain_lib.abs(handle)
+    plain_lib.memcmp(ctypes.pointer(sample_times),
+                     ctypes.pointer(sample_values), ctypes.c_long(0))
+
+
+def poll_prototyped():
+    """Polls with declared prototypes and cached references"""
+    prototyped_lib.abs(handle)
+    prototyped_lib.memcmp(p_sample_times, p_sample_values, c_num_samples)
+
+
+def best_time(function):
+    """Returns the best time per call of several timings, in s"""
+
+    times = []
+
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+
+        for _ in range(POLLS):
+            function()
+
+        times.append((time.perf_counter() - start) / POLLS)
+
+    return min(times)
+
+print("{0:>12} {1:>16}".format("calls", "per poll (ns)"))
+
+for name, function in [("plain", poll_plain),
+                       ("prototyped", poll_prototyped)]:
+    print("{0:>12} {1:>16.0f}".format(name, best_time(function) * 1e9))
@@ -0,0 +1,96 @@
+"""Reading block codec benchmark
+
+Checks that blocks of simulated readings survive a round trip through
+:mod:`datalog.codec`, and compares the size and encode and decode throughput
+of the codec, with and without zlib, against the uncompressed binary
+representation and the binary representation compressed with zlib.
+
+Sean Leavey
+https://github.com/SeanDS/
+"""
+
+import time
+import zlib
+
+import numpy
+
+from datalog import codec
+from datalog.data import ReadingBlock
+
+# readings per block
+READINGS = 100000
+
+# channels per reading
+CHANNELS = list(range(1, 17))
+
+# time between readings, in ms
+SAMPLE_TIME = 1000
+
+# number of times to repeat each timing
+REPEATS = 5
+
+
+def make_blocks():
+    """Creates blocks of readings with constant sample times and slowly \
+    changing values"""
+
+    rng = numpy.random.default_rng(0)
+
+    times = 1500000000000 + numpy.arange(READINGS) * SAMPLE_TIME
+
+    # slowly drifting ADC counts
+    counts = numpy.cumsum(rng.integers(-20, 21, (READINGS, len(CHANNELS))),
+                          axis=0) + 100000
+
+    # the same counts converted to volts
+    volts = counts * (2.5 / 2 ** 24)
+
+    return {
+        "counts": ReadingBlock(times, CHANNELS, counts),
+        "volts": ReadingBlock(times, CHANNELS, volts)
+    }
+
+def best_time(function, *args):
+    """Returns the best time of several calls to the function, in s"""
+
+    times = []
+
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+# encodings: name, encode function and decode function
+ENCODINGS = [
+    ("binary", lambda block: block.binary_repr(),
+     ReadingBlock.instance_from_binary),
+    ("binary+zlib", lambda block: zlib.compress(block.binary_repr()),
+     lambda data: ReadingBlock.instance_from_binary(zlib.decompress(data))),
+    ("codec", codec.encode_block, codec.decode_block),
+    ("codec+zlib", lambda block: zlib.compress(codec.encode_block(block)),
+     lambda data: codec.decode_block(zlib.decompress(data)))
+]
+
+print("{0:>8} {1:>12} {2:>12} {3:>8} {4:>14} {5:>14}".format(
+    "values", "encoding", "bytes", "ratio", "encode (MB/s)", "decode (MB/s)"))
+
+for name, block in make_blocks().items():
+    raw_size = len(block.binary_repr())
+
+    for encoding, encode, decode in ENCODINGS:
+        data = encode(block)
+        decoded = decode(data)
+
+        # check the round trip
+        assert numpy.array_equal(decoded.reading_times, block.reading_times)
+        assert numpy.array_equal(decoded.values, block.values)
+        assert decoded.channels == block.channels
+
+        encode_time = best_time(encode, block)
+        decode_time = best_time(decode, data)
+
+        print("{0:>8} {1:>12} {2:>12} {3:>8.1f} {4:>14.0f} {5:>14.0f}".format(
+            name, encoding, len(data), raw_size / len(data),
+            raw_size / encode_time / 1e6, raw_size / decode_time / 1e6))
@@ -0,0 +1,71 @@
+"""DataStore insert benchmark
+
+Measures the cost of inserting readings into a full
+:class:`~datalog.data.DataStore` for a range of datastore sizes. Since the
+datastore is a circular buffer, the cost per insert should not depend on the
+datastore size.
+
+Sean Leavey
+https://github.com/SeanDS/
+"""
+
+import time
+
+from datalog.data import DataStore, Reading
+
+# datastore sizes to test
+SIZES = [1000, 10000, 100000, 1000000]
+
+# channels per reading
+CHANNELS = list(range(1, 17))
+
+# number of inserts to time for each size
+INSERTS = 1000
+
+# readings per batch insert, like a typical get_readings() call
+BATCH_SIZE = 100
+
+
+def make_readings(start_time, count):
+    """Creates readings with consecutive times"""
+    return [Reading(start_time + i, CHANNELS, [i] * len(CHANNELS))
+            for i in range(count)]
+
+def fill(datastore):
+    """Fills the datastore to capacity, returning the next reading time"""
+
+    next_time = 1
+
+    while datastore.num_readings < datastore.max_size:
+        datastore.insert(make_readings(next_time, 10000))
+        next_time += 10000
+
+    return next_time
+
+def time_inserts(datastore, next_time, batch_size):
+    """Times inserts of batches of readings, returning the mean time per \
+    insert in µs"""
+
+    # create readings up front so only the insert is timed
+    batches = [make_readings(next_time + i * batch_size, batch_size)
+               for i in range(INSERTS)]
+
+    start = time.perf_counter()
+
+    for batch in batches:
+        datastore.insert(batch)
+
+    return (time.perf_counter() - start) / INSERTS * 1e6
+
+print("{0:>10} {1:>16} {2:>16}".format("max_size", "single (µs)",
+                                       "batch of {0} (µs)".format(BATCH_SIZE)))
+
+for size in SIZES:
+    datastore = DataStore(size)
+    next_time = fill(datastore)
+
+    single = time_inserts(datastore, next_time, 1)
+    next_time += INSERTS
+    batch = time_inserts(datastore, next_time, BATCH_SIZE)
+
+    print("{0:>10} {1:>16.1f} {2:>16.1f}".format(size, single, batch))
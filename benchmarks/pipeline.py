@@ -0,0 +1,99 @@
+"""Acquisition pipeline benchmark
+
+Runs a seeded :class:`~datalog.adc.hrdl.picolog.PicoLogAdc24Sim` faster than
+real time through a :class:`~datalog.adc.fetch.Retriever` into a
+:class:`~datalog.data.DataStore`, served by a
+:class:`~datalog.network.DataServer`, while a client repeatedly requests the
+latest readings. Reports the readings stored, any readings missing from the
+stored sequence and the server request rate and latency.
+
+Sean Leavey
+https://github.com/SeanDS/
+"""
+
+import time
+import threading
+import urllib.request
+
+import numpy
+
+from datalog.adc.config import AdcConfig
+from datalog.adc.hrdl.picolog import PicoLogAdc24Sim
+from datalog.data import DataStore
+from datalog.network import DataServer
+
+# rate of the simulated clock relative to real time
+SPEED = 100
+
+# real time to run for, in s
+DURATION = 10
+
+# channels to enable, and their waveforms
+WAVEFORMS = {
+    1: "sine:amplitude=100000,period=60000",
+    2: "drift:rate=10",
+    3: "step:period=30000",
+    4: "noise:sigma=1000"
+}
+
+# simulated sample time, in ms; the fastest possible for the channels
+SAMPLE_TIME = 60 * len(WAVEFORMS)
+
+config = AdcConfig()
+config['device']['sample_time'] = str(SAMPLE_TIME)
+config['device']['conversion_time'] = '0'
+config['device']['sample_buf_len'] = '100000'
+config['fetch']['poll_time'] = '100'
+config['server']['port'] = '0'
+config['server']['max_readings_per_request'] = '1000'
+config['simulator']['seed'] = '0'
+config['simulator']['speed'] = str(SPEED)
+
+# enable only the test channels
+for channel in range(1, PicoLogAdc24Sim.NUM_CHANNELS + 1):
+    config.remove_option('picolog', 'channel_{0}'.format(channel))
+
+for channel, waveform in WAVEFORMS.items():
+    config['picolog']['channel_{0}'.format(channel)] = "true"
+    config['simulator']['channel_{0}_waveform'.format(channel)] = waveform
+
+adc = PicoLogAdc24Sim(config)
+datastore = DataStore(DURATION * SPEED * 1000 // SAMPLE_TIME * 2)
+
+server = DataServer(datastore, config)
+server_thread = threading.Thread(target=server.serve_forever)
+server_thread.start()
+
+url = "http://localhost:{0}/?format=binary&desc=true".format(
+    server.server_address[1])
+
+# request latencies, in s
+latencies = []
+
+with adc.get_retriever(datastore):
+    end_time = time.monotonic() + DURATION
+
+    while time.monotonic() < end_time:
+        start = time.perf_counter()
+
+        with urllib.request.urlopen(url) as response:
+            response.read()
+
+        latencies.append(time.perf_counter() - start)
+
+server.shutdown()
+server.server_close()
+server_thread.join()
+
+times, _ = datastore.to_numpy()
+missing = int(numpy.sum(numpy.diff(times) // SAMPLE_TIME - 1))
+
+print("speed: {0}x, sample time: {1} ms, duration: {2} s".format(
+    SPEED, SAMPLE_TIME, DURATION))
+print("readings stored: {0} ({1:.0f}/s), missing: {2}".format(
+    len(times), len(times) / DURATION, missing))
+print("simulated time: {0:.0f} s".format((times[-1] - times[0]) / 1000))
+print("requests: {0} ({1:.0f}/s), mean latency: {2:.2f} ms, max latency: "
+      "{3:.2f} ms".format(len(latencies), len(latencies) / DURATION,
+                          numpy.mean(latencies) * 1000,
+                          numpy.max(latencies) * 1000))
@@ -0,0 +1,62 @@
+"""Simulated ADC benchmark
+
+Measures how quickly :class:`~datalog.adc.hrdl.picolog.PicoLogAdc24Sim` can
+generate and deliver a backlog of samples, for a range of backlog sizes. The
+cost per sample should not grow with the backlog, so the simulator can emulate
+short sample times without becoming the bottleneck.
+
+Sean Leavey
+https://github.com/SeanDS/
+"""
+
+import time
+
+from datalog.adc.config import AdcConfig
+from datalog.adc.hrdl.picolog import PicoLogAdc24Sim
+
+# backlog sizes to test, in samples per channel
+BACKLOGS = [1000, 10000, 100000, 1000000]
+
+# channels to enable
+CHANNELS = [1, 2, 3, 4]
+
+# sample time, in ms
+SAMPLE_TIME = 1000
+
+config = AdcConfig()
+config['device']['sample_time'] = str(SAMPLE_TIME)
+config['device']['sample_buf_len'] = str(max(BACKLOGS) * len(CHANNELS))
+
+# enable only the test channels
+for channel in range(1, PicoLogAdc24Sim.NUM_CHANNELS + 1):
+    config.remove_option('picolog', 'channel_{0}'.format(channel))
+
+for channel in CHANNELS:
+    config['picolog']['channel_{0}'.format(channel)] = "true"
+
+adc = PicoLogAdc24Sim(config)
+
+print("{0:>10} {1:>14} {2:>16}".format("backlog", "fetch (ms)",
+                                       "per sample (ns)"))
+
+with adc.get_retriever(None) as retriever:
+    # stop polling, so that the backlog is only fetched here
+    retriever.stop()
+    retriever.join()
+
+    for backlog in BACKLOGS:
+        # pretend the last fetch was long enough ago to build the backlog
+        adc._last_fake_request_time = int(round(time.time() * 1000)) \
+                                      - backlog * SAMPLE_TIME
+
+        start = time.perf_counter()
+
+        fetched = 0
+
+        while adc.ready():
+            fetched += len(adc.get_reading_block())
+
+        elapsed = time.perf_counter() - start
+
+        print("{0:>10} {1:>14.1f} {2:>16.1f}".format(
+            fetched, elapsed * 1000, elapsed / fetched * 1e9))
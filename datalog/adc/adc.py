@@ -2,10 +2,13 @@
 
 import logging
 import abc
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+
+import numpy
 
 from datalog.device import Device
-from .fetch import Retriever
+from datalog.data import ReadingBlock
+from .fetch import Retriever, AsyncRetriever
 
 # logger
 logger = logging.getLogger("datalog.adc")
@@ -27,6 +30,9 @@ class Adc(Device, metaclass=abc.ABCMeta):
         # enabled channel numbers
         self.enabled_channels = set()
 
+        # conversion factors from counts to volts, by channel
+        self._calibration = {}
+
     @classmethod
     def load_from_config(cls, config):
         """Loads the appropriate ADC class given the settings in the specified \
@@ -87,6 +93,46 @@ class Adc(Device, metaclass=abc.ABCMeta):
             # close the device
             self.close()
 
+    @asynccontextmanager
+    async def aretriever(self, datastore, executor=None):
+        """Get an :class:`AsyncRetriever` for the ADC to poll for readings on a \
+        regular interval from the running event loop
+
+        Blocking ADC calls are made on a dedicated executor thread.
+
+        :param datastore: :class:`~datalog.data.DataStore` to send readings to
+        :param executor: executor to make ADC calls with, or None to create a \
+        single thread executor
+        :type executor: :class:`concurrent.futures.Executor`
+        """
+
+        # create the retriever
+        retriever = AsyncRetriever(self, datastore, self.config, executor)
+
+        try:
+            if not await retriever.call(self.is_open):
+                await retriever.call(self.open)
+
+            # configure device
+            await retriever.call(self.configure)
+
+            # start polling
+            await retriever.start()
+
+            try:
+                # return the retriever to the caller
+                yield retriever
+            finally:
+                # stop polling and wait until it finishes
+                logger.debug("Waiting for retriever to stop")
+                await retriever.stop()
+                logger.info("Retriever stopped")
+
+                # close the device
+                await retriever.call(self.close)
+        finally:
+            retriever.close()
+
     @abc.abstractmethod
     def open(self):
         """Opens unit"""
@@ -99,6 +145,22 @@ class Adc(Device, metaclass=abc.ABCMeta):
 
         return NotImplemented
 
+    def start_sampling(self, sample_method="stream"):
+        """Starts sampling with the specified method
+
+        Only streaming is supported by default.
+
+        :param sample_method: sample method
+        :type sample_method: str
+        :raises ValueError: if the sample method is not supported
+        """
+
+        if sample_method != "stream":
+            raise ValueError("Unsupported sample method: {0}".format(
+                sample_method))
+
+        self.stream()
+
     @abc.abstractmethod
     def close(self):
         """Closes unit"""
@@ -231,6 +293,18 @@ class Adc(Device, metaclass=abc.ABCMeta):
 
         return NotImplemented
 
+    def get_reading_block(self):
+        """Gets readings as a block
+
+        Subclasses can override this to avoid creating a reading object for
+        each time.
+
+        :return: readings, in chronological order
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        return ReadingBlock.instance_from_readings(self.get_readings())
+
     @abc.abstractmethod
     def get_enabled_channels_count(self):
         """Gets number of enabled channels
@@ -241,6 +315,41 @@ class Adc(Device, metaclass=abc.ABCMeta):
 
         return NotImplemented
 
+    def calibrate(self):
+        """Computes the conversion factors from counts to volts for the \
+        enabled channels
+
+        The factors are cached, so that conversions do not need to query the
+        unit. They are computed when the unit is configured, and a channel's
+        factor is recomputed when next needed after its voltage range is
+        changed.
+        """
+
+        self._calibration = {channel: self._get_calibration(channel)
+                             for channel in sorted(self.enabled_channels)}
+
+    def _invalidate_calibration(self, channel):
+        """Discards the cached conversion factor for the specified channel
+
+        :param channel: channel number
+        :type channel: int
+        """
+
+        self._calibration.pop(channel, None)
+
+    def _get_calibration(self, channel):
+        """Fetches the conversion factor from counts to volts for the \
+        specified channel from the unit"""
+
+        # get minimum and maximum counts for this channel
+        _, max_counts = self._get_min_max_adc_counts(channel)
+
+        # get maximum voltage (on a single side of the input)
+        v_max = self._get_channel_max_voltage(channel)
+
+        # calculate conversion
+        return v_max / max_counts
+
     def get_calibration(self, channel):
         """Returns the conversion factor from counts to volts for the
         specified channel
@@ -255,31 +364,61 @@ class Adc(Device, metaclass=abc.ABCMeta):
         :rtype: float
         """
 
-        # get minimum and maximum counts for this channel
-        _, max_counts = self._get_min_max_adc_counts(channel)
+        channel = int(channel)
 
-        # get maximum voltage (on a single side of the input)
-        v_max = self._get_channel_max_voltage(channel)
+        if channel not in self._calibration:
+            self._calibration[channel] = self._get_calibration(channel)
 
-        # calculate conversion
-        return v_max / max_counts
+        return self._calibration[channel]
+
+    def get_calibrations(self, channels):
+        """Returns the conversion factors from counts to volts for the \
+        specified channels
+
+        :param channels: channel numbers
+        :type channels: List[int]
+        :return: conversion factors, in the order of the channels
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        return numpy.array([self.get_calibration(channel)
+                            for channel in channels], dtype=numpy.float64)
 
     def counts_to_volts(self, counts, channel):
         """Converts the specified counts to volts
 
+        Use :meth:`reading_block_to_volts` to convert blocks of readings.
+
         :param counts: the counts to convert
-        :type counts: int
+        :type counts: List[int]
         :param channel: the channel number this measurements corresponds to
         :type channel: int
         :return: voltage equivalent of counts
-        :rtype: float
+        :rtype: List[float]
         """
 
         # get conversion
         scale = self.get_calibration(channel)
 
         # return voltages
-        return [count * scale for count in counts]
+        return (numpy.asarray(counts, dtype=numpy.float64) * scale).tolist()
+
+    def reading_block_to_volts(self, block):
+        """Converts the counts in the specified reading block to volts
+
+        Each column of values is multiplied by its channel's conversion factor
+        in a single vectorised operation.
+
+        :param block: readings in counts
+        :type block: :class:`~datalog.data.ReadingBlock`
+        :return: readings in volts
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        scales = self.get_calibrations(block.channels)
+
+        return ReadingBlock(block.reading_times, block.channels,
+                            block.values * scales)
 
     @abc.abstractmethod
     def _get_min_max_adc_counts(self, channel):
@@ -55,7 +55,37 @@ class AdcConfig(BaseConfig):
         # retriever settings
         self['fetch'] = {
             # time to wait between ADC polls (ms)
-            'poll_time': '10000'
+            'poll_time': '10000',
+            # schedule polls by estimated ADC buffer fill level, using
+            # poll_time as the longest time between polls
+            'adaptive': 'false',
+            # buffer fill fraction to poll at in adaptive mode
+            'target_fill': '0.5',
+            # shortest time between polls in adaptive mode (ms)
+            'min_poll_time': '10',
+            # ADC sample method: stream, block or window
+            'sample_method': 'stream'
+        }
+
+        # multiple device settings
+        self['devices'] = {
+            # names of devices to run with an orchestrator, separated by commas
+            'names': '',
+            # time after which merged readings are stored without waiting for
+            # lagging devices (ms)
+            'max_lag': '10000'
+        }
+
+        # simulated ADC settings
+        self['simulator'] = {
+            # random seed, or empty for a different seed each run
+            'seed': '',
+            # rate of the simulated clock relative to real time
+            'speed': '1',
+            # waveform of channels without a channel_<n>_waveform setting,
+            # e.g. "sine:amplitude=100000,period=60000"; see
+            # datalog.adc.simulation.get_waveform
+            'waveform': 'uniform'
         }
 
         # library paths
@@ -1,15 +1,36 @@
 """Data retrieval from ADC unit"""
 
 import time
+import asyncio
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # logger
 logger = logging.getLogger("datalog.fetch")
 
 
-class Retriever(threading.Thread):
-    """Class to retrieve data from an ADC and insert it into a datastore"""
+class BaseRetriever(object):
+    """Base class to retrieve data from an ADC and insert it into a datastore
+
+    By default the ADC is polled every ``poll_time`` ms. In adaptive mode, the
+    rate at which the ADC's buffer fills is estimated from the sample time and
+    the size of recent payloads, and each poll is scheduled for when the buffer
+    is expected to reach the ``target_fill`` fraction. ``poll_time`` is then the
+    longest time between polls and ``min_poll_time`` the shortest. When
+    streaming, a poll finding the buffer full only bounds the fill rate from
+    below, so the ADC is polled every ``min_poll_time`` until a poll finds the
+    buffer below the target fill.
+    """
+
+    # fill fraction above which a poll is counted as at risk of overrun
+    OVERRUN_FILL_FRACTION = 0.9
+
+    # weight given to the latest payload when estimating the fill rate
+    RATE_SMOOTHING = 0.5
+
+    # ADC sample methods
+    SAMPLE_METHODS = ("stream", "block", "window")
 
     def __init__(self, adc, datastore, config):
         """Initialises the retriever
@@ -19,9 +40,6 @@ class Retriever(threading.Thread):
         :param config: configuration class
         """
 
-        # initialise threading
-        threading.Thread.__init__(self)
-
         self.config = config
 
         # store parameters
@@ -34,22 +52,265 @@ class Retriever(threading.Thread):
         # retrieval flag
         self.retrieving = False
 
-        # default context flag
-        self.context = False
-
         # time in ms between polls
         poll_time = int(self.config['fetch']['poll_time'])
 
-        if poll_time < 1000:
-            # since the runner sleeps for 1s between checks, times less than
-            # 1 second aren't supported
-            raise ValueError("Poll times less than 1000 ms aren't supported")
+        if poll_time <= 0:
+            raise ValueError("Poll time must be positive")
 
         self.poll_time = poll_time
         logger.info("Poll time: {0:.2f} ms".format(self.poll_time))
 
+        # ADC sample method
+        self.sample_method = self.config['fetch'].get('sample_method',
+                                                      'stream')
+
+        if self.sample_method not in self.SAMPLE_METHODS:
+            raise ValueError("Sample method must be one of {0}".format(
+                ", ".join(self.SAMPLE_METHODS)))
+
+        # adaptive polling settings
+        self.adaptive = self.config['fetch'].getboolean('adaptive')
+        self.target_fill = float(self.config['fetch']['target_fill'])
+        self.min_poll_time = int(self.config['fetch']['min_poll_time'])
+
+        if self.adaptive:
+            if not 0 < self.target_fill <= 1:
+                raise ValueError("Target fill must be between 0 and 1")
+
+            if not 0 < self.min_poll_time <= self.poll_time:
+                raise ValueError("Minimum poll time must be positive and no "
+                                 "more than the poll time")
+
+            logger.info("Adaptive polling with target fill %.2f",
+                        self.target_fill)
+
+        # estimated buffer fill rate, in readings per ms
+        self.fill_rate = 1 / int(self.config['device']['sample_time'])
+
+        # monotonic time of the last poll, in s
+        self._last_poll_time = None
+
+        # whether the buffer may have overrun since the buffer was last found
+        # below the target fill
+        self._saturated = False
+
+        # poll metrics
+        self.polls = 0
+        self.empty_polls = 0
+        self.overrun_risk_polls = 0
+        self.readings_fetched = 0
+        self.fill_fraction = 0
+        self.max_fill_fraction = 0
+        self.current_poll_time = self.poll_time
+
+    def _get_next_poll_time(self, next_poll_time):
+        """Gets the monotonic time of the next poll, after a poll
+
+        Polls are scheduled on the monotonic clock so that they neither drift
+        nor follow steps in the system time.
+
+        :param next_poll_time: monotonic time the last poll was scheduled for, \
+        in s
+        :type next_poll_time: float
+        :return: monotonic time of the next poll, in s
+        :rtype: float
+        """
+
+        # poll period in s
+        period = self._get_period()
+
+        if self.adaptive:
+            # schedule relative to the last poll
+            return self._last_poll_time + period
+
+        # skip any polls missed while fetching
+        missed = int((time.monotonic() - next_poll_time) // period)
+
+        return next_poll_time + (max(missed, 0) + 1) * period
+
+    def _get_period(self):
+        """Gets the time until the next poll
+
+        :return: poll period, in s
+        :rtype: float
+        """
+
+        if not self.adaptive:
+            self.current_poll_time = self.poll_time
+        elif self._saturated:
+            # the fill rate is unknown, so poll as often as possible
+            self.current_poll_time = self.min_poll_time
+        elif self.fill_rate <= 0:
+            # the buffer isn't filling
+            self.current_poll_time = self.poll_time
+        else:
+            # time for the buffer to reach the target fill
+            fill_time = self.target_fill * self.buffer_capacity / self.fill_rate
+
+            self.current_poll_time = min(max(fill_time, self.min_poll_time),
+                                         self.poll_time)
+
+        return self.current_poll_time / 1000
+
+    @property
+    def buffer_capacity(self):
+        """Number of readings the ADC can buffer between polls
+
+        :return: buffer capacity, in readings
+        :rtype: int
+        """
+
+        # each reading takes one buffer value per enabled channel
+        channel_count = max(len(self.adc.enabled_channels), 1)
+
+        return int(self.config['device']['sample_buf_len']) // channel_count
+
+    def get_metrics(self):
+        """Gets poll metrics
+
+        :return: number of polls, polls that found no readings, polls at risk \
+        of overrun, readings fetched, last and maximum buffer fill fractions, \
+        fill fraction expected at the next poll, estimated fill rate in \
+        readings per second and current time between polls in ms
+        :rtype: Dict
+        """
+
+        return {
+            "polls": self.polls,
+            "empty_polls": self.empty_polls,
+            "overrun_risk_polls": self.overrun_risk_polls,
+            "readings_fetched": self.readings_fetched,
+            "fill_fraction": self.fill_fraction,
+            "max_fill_fraction": self.max_fill_fraction,
+            "expected_fill_fraction": min(self.fill_rate
+                                          * self.current_poll_time
+                                          / self.buffer_capacity, 1),
+            "fill_rate": self.fill_rate * 1000,
+            "poll_time": self.current_poll_time
+        }
+
+    def _poll_adc(self):
+        """Gets readings from the ADC, if it has any
+
+        :return: readings, or None if the ADC has none
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        logger.debug("Polling ADC")
+
+        # check if ADC has values to retrieve
+        if not self.adc.ready():
+            logger.debug("No new readings")
+            return None
+
+        # get readings
+        return self.adc.get_reading_block()
+
+    def _store_readings(self, readings):
+        """Inserts the specified polled readings into the datastore
+
+        :param readings: readings, or None if the poll found none
+        :type readings: :class:`~datalog.data.ReadingBlock`
+        :return: number of readings stored
+        :rtype: int
+        """
+
+        self.polls += 1
+
+        if readings is None:
+            n_readings = 0
+        else:
+            # number of readings retrieved
+            n_readings = len(readings)
+
+        # make sure readings aren't empty
+        if n_readings > 0:
+            # store data
+            self.datastore.insert(readings)
+
+            logger.debug("Fetched %i readings", n_readings)
+
+        self._update_metrics(n_readings)
+
+        return n_readings
+
+    def _update_metrics(self, n_readings):
+        """Updates the poll metrics and fill rate estimate after a poll
+
+        :param n_readings: number of readings fetched
+        :type n_readings: int
+        """
+
+        now = time.monotonic()
+
+        if n_readings == 0:
+            self.empty_polls += 1
+
+        self.readings_fetched += n_readings
+
+        # buffer fill fraction at this poll
+        self.fill_fraction = min(n_readings / self.buffer_capacity, 1)
+        self.max_fill_fraction = max(self.max_fill_fraction,
+                                     self.fill_fraction)
+
+        # in block and window modes a full buffer is expected
+        if self.sample_method == "stream" \
+            and self.fill_fraction >= self.OVERRUN_FILL_FRACTION:
+            logger.warning("ADC buffer %.0f%% full", self.fill_fraction * 100)
+            self.overrun_risk_polls += 1
+
+        if self.sample_method == "stream" and self.fill_fraction >= 1:
+            # readings may have been lost, so the fill rate could be higher
+            # than the payload suggests
+            self._saturated = True
+        elif self.fill_fraction < self.target_fill:
+            self._saturated = False
+
+        if self._last_poll_time is not None:
+            # time since last poll, in ms
+            elapsed = (now - self._last_poll_time) * 1000
+
+            if elapsed > 0:
+                rate = n_readings / elapsed
+
+                if self._saturated:
+                    # the payload rate is a lower bound
+                    self.fill_rate = max(self.fill_rate, rate)
+                else:
+                    # smoothed estimate of fill rate
+                    self.fill_rate += self.RATE_SMOOTHING \
+                                      * (rate - self.fill_rate)
+
+        self._last_poll_time = now
+
+
+
+class Retriever(BaseRetriever, threading.Thread):
+    """Class to retrieve data from an ADC in a thread and insert it into a \
+    datastore"""
+
+    def __init__(self, adc, datastore, config):
+        """Initialises the retriever
+
+        :param adc: the ADC object to retrieve data from
+        :param datastore: the datastore to store data in
+        :param config: configuration class
+        """
+
+        # initialise threading
+        threading.Thread.__init__(self)
+
+        super(Retriever, self).__init__(adc, datastore, config)
+
+        # default context flag
+        self.context = False
+
+        # event set to wake the run loop when stopping
+        self._stop_event = threading.Event()
+
     def run(self):
-        """Starts streaming data from the ADC"""
+        """Starts sampling data from the ADC"""
 
         if not self.context:
             raise Exception("This can only be run within "
@@ -58,57 +319,160 @@ class Retriever(threading.Thread):
         if not self.adc.is_open():
             raise Exception("Device is not open")
 
-        # start streaming
-        self.adc.stream()
+        # start sampling
+        self.adc.start_sampling(self.sample_method)
 
         # start time
         self.start_time = int(round(time.time() * 1000))
 
-        # next poll time is now plus the poll time (in ms)
-        next_poll_time = int(round(time.time() * 1000)) + self.poll_time
+        self._last_poll_time = time.monotonic()
+        next_poll_time = self._last_poll_time + self._get_period()
 
         # set status on
         self.retrieving = True
 
         # main run loop
         while self.retrieving:
-            # time in ms
-            now = int(round(time.time() * 1000))
+            # sleep until the next poll, waking early if stopped
+            delay = next_poll_time - time.monotonic()
+
+            if delay > 0 and self._stop_event.wait(delay):
+                break
 
-            if now < next_poll_time:
-                # sleep, but not for too long so that the thread exits quickly
-                # when asked
-                time.sleep(1)
-            else:
-                # fetch latest readings
-                self.fetch_readings()
+            # fetch latest readings
+            self.fetch_readings()
 
-                # set the next poll time
-                next_poll_time += self.poll_time
+            next_poll_time = self._get_next_poll_time(next_poll_time)
 
     def fetch_readings(self):
-        logger.debug("Polling ADC")
+        """Fetches readings from the ADC and inserts them into the datastore
 
-        # check if ADC has values to retrieve
-        if not self.adc.ready():
-            logger.debug("No new readings")
-            return
+        :return: number of readings fetched
+        :rtype: int
+        """
 
-        # get readings
-        readings = self.adc.get_readings()
+        return self._store_readings(self._poll_adc())
 
-        # number of readings retrieved
-        n_readings = len(readings)
+    def stop(self):
+        """Stops the ADC data stream"""
 
-        # make sure readings aren't empty
-        if n_readings > 0:
-            # store data
-            self.datastore.insert(readings)
+        # stop retrieving data
+        self.retrieving = False
 
-            logger.debug("Fetched %i readings", n_readings)
+        # wake the run loop
+        self._stop_event.set()
 
-    def stop(self):
-        """Stops the ADC data stream"""
+
+class AsyncRetriever(BaseRetriever):
+    """Class to retrieve data from an ADC and insert it into a datastore from \
+    an asyncio event loop
+
+    Scheduling and inserts run on the event loop, while the blocking calls to
+    the ADC run on a dedicated executor thread.
+    """
+
+    def __init__(self, adc, datastore, config, executor=None):
+        """Initialises the retriever
+
+        :param adc: the ADC object to retrieve data from
+        :param datastore: the datastore to store data in
+        :param config: configuration class
+        :param executor: executor to make ADC calls with, or None to create a \
+        single thread executor
+        :type executor: :class:`concurrent.futures.Executor`
+        """
+
+        super(AsyncRetriever, self).__init__(adc, datastore, config)
+
+        # executor for blocking ADC calls
+        self._own_executor = executor is None
+
+        if self._own_executor:
+            executor = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="datalog-adc")
+
+        self.executor = executor
+
+        # run loop task and stop event, created when started
+        self._task = None
+        self._stop_event = None
+
+    async def call(self, function, *args):
+        """Calls the specified blocking function on the ADC executor
+
+        :param function: function to call
+        :return: function's return value
+        """
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def start(self):
+        """Starts sampling data from the ADC and polling it in a task"""
+
+        if not await self.call(self.adc.is_open):
+            raise Exception("Device is not open")
+
+        # start sampling
+        await self.call(self.adc.start_sampling, self.sample_method)
+
+        # start time
+        self.start_time = int(round(time.time() * 1000))
+
+        self._last_poll_time = time.monotonic()
+        self._stop_event = asyncio.Event()
+
+        # set status on
+        self.retrieving = True
+
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        next_poll_time = self._last_poll_time + self._get_period()
+
+        # main run loop
+        while self.retrieving:
+            # sleep until the next poll, waking early if stopped
+            delay = next_poll_time - time.monotonic()
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+            # fetch latest readings
+            await self.fetch_readings()
+
+            next_poll_time = self._get_next_poll_time(next_poll_time)
+
+    async def fetch_readings(self):
+        """Fetches readings from the ADC and inserts them into the datastore
+
+        :return: number of readings fetched
+        :rtype: int
+        """
+
+        return self._store_readings(await self.call(self._poll_adc))
+
+    async def stop(self):
+        """Stops polling and waits for the run loop to finish"""
 
         # stop retrieving data
         self.retrieving = False
+
+        if self._stop_event is not None:
+            # wake the run loop
+            self._stop_event.set()
+
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def close(self):
+        """Shuts down the ADC executor, if it was created by this retriever"""
+
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
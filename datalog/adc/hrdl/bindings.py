@@ -0,0 +1,95 @@
+"""ctypes bindings for the PicoLog high resolution data logger library
+
+Without declared prototypes, ctypes converts every argument and return value
+on each call by inspecting its Python type, and assumes C ``int`` for both, so
+that e.g. a pointer passed as a Python integer is silently truncated to 32
+bits. The prototypes here are declared once, when the library is loaded, so
+that calls convert their arguments directly to the library's types.
+
+Buffers are passed as ``void *``, so that arrays, :func:`ctypes.pointer`
+objects and cached :func:`ctypes.byref` references are all accepted.
+"""
+
+import ctypes
+import logging
+
+# logger
+logger = logging.getLogger("datalog.bindings")
+
+# function prototypes, as return type and argument types, by function name
+PROTOTYPES = {
+    "HRDLOpenUnit": (ctypes.c_int16, []),
+    "HRDLCloseUnit": (ctypes.c_int16, [ctypes.c_int16]),
+    "HRDLStop": (ctypes.c_int16, [ctypes.c_int16]),
+    "HRDLReady": (ctypes.c_int16, [ctypes.c_int16]),
+    "HRDLGetUnitInfo": (ctypes.c_int16, [ctypes.c_int16, ctypes.c_void_p,
+                                         ctypes.c_int16, ctypes.c_int16]),
+    "HRDLSetAnalogInChannel": (ctypes.c_int16, [ctypes.c_int16,
+                                                ctypes.c_int16,
+                                                ctypes.c_int16,
+                                                ctypes.c_int16,
+                                                ctypes.c_int16]),
+    "HRDLSetInterval": (ctypes.c_int16, [ctypes.c_int16, ctypes.c_int32,
+                                         ctypes.c_int16]),
+    "HRDLRun": (ctypes.c_int16, [ctypes.c_int16, ctypes.c_int32,
+                                 ctypes.c_int16]),
+    "HRDLGetTimesAndValues": (ctypes.c_int32, [ctypes.c_int16,
+                                               ctypes.c_void_p,
+                                               ctypes.c_void_p,
+                                               ctypes.c_void_p,
+                                               ctypes.c_int32]),
+    "HRDLGetValues": (ctypes.c_int32, [ctypes.c_int16, ctypes.c_void_p,
+                                       ctypes.c_void_p, ctypes.c_int32]),
+    "HRDLGetSingleValue": (ctypes.c_int16, [ctypes.c_int16, ctypes.c_int16,
+                                            ctypes.c_int16, ctypes.c_int16,
+                                            ctypes.c_int16, ctypes.c_void_p,
+                                            ctypes.c_void_p]),
+    "HRDLGetNumberOfEnabledChannels": (ctypes.c_int16, [ctypes.c_int16,
+                                                        ctypes.c_void_p]),
+    "HRDLGetMinMaxAdcCounts": (ctypes.c_int16, [ctypes.c_int16,
+                                                ctypes.c_void_p,
+                                                ctypes.c_void_p,
+                                                ctypes.c_int16]),
+    "HRDLSetMains": (ctypes.c_int16, [ctypes.c_int16, ctypes.c_int16])
+}
+
+
+def declare_prototypes(lib, prototypes=None):
+    """Declares the return and argument types of the library's functions
+
+    Functions missing from the library, e.g. in older versions, are skipped.
+
+    :param lib: loaded library
+    :type lib: :class:`ctypes.CDLL`
+    :param prototypes: return type and argument types by function name, or \
+    None for :data:`PROTOTYPES`
+    :type prototypes: dict
+    :return: the library
+    :rtype: :class:`ctypes.CDLL`
+    """
+
+    if prototypes is None:
+        prototypes = PROTOTYPES
+
+    for name, (restype, argtypes) in prototypes.items():
+        try:
+            function = getattr(lib, name)
+        except AttributeError:
+            logger.debug("Library has no function %s", name)
+            continue
+
+        function.restype = restype
+        function.argtypes = argtypes
+
+    return lib
+
+
+def load_library(path):
+    """Loads the library and declares its function prototypes
+
+    :param path: path to library
+    :type path: str
+    :rtype: :class:`ctypes.CDLL`
+    """
+
+    return declare_prototypes(ctypes.CDLL(path))
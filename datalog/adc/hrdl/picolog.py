@@ -3,10 +3,13 @@
 import time
 import logging
 import ctypes
-import random
+
+import numpy
 
 from datalog.adc.adc import Adc
-from datalog.data import Reading
+from datalog.data import ReadingBlock
+from datalog.adc.simulation import ScaledClock, get_waveform
+from .bindings import load_library
 from .constants import Handle, Channel, Status, Info, Error, SettingsError, \
                        VoltageRange, InputType, ConversionTime, SampleMethod
 
@@ -74,6 +77,14 @@ class PicoLogAdc24(Adc):
         # sample method
         self._c_sample_method = ctypes.c_int16()
 
+        # references to the buffers, created once rather than on each call
+        self._p_str_buf = ctypes.byref(self._c_str_buf)
+        self._p_sample_times = ctypes.byref(self._c_sample_times)
+        self._p_sample_values = ctypes.byref(self._c_sample_values)
+        self._p_enabled_channels = ctypes.byref(self._c_enabled_channels)
+        self._p_minimum_count = ctypes.byref(self._c_minimum_count)
+        self._p_maximum_count = ctypes.byref(self._c_maximum_count)
+
         # default channel voltages
         self.channel_voltages = {i: self.DEFAULT_CHANNEL_VOLTAGE \
                                 for i in range(1, self.NUM_CHANNELS + 1)}
@@ -83,6 +94,12 @@ class PicoLogAdc24(Adc):
         # stream start time
         self.stream_start_timestamp = None
 
+        # current sample method, set when the unit is run
+        self.sample_method = None
+
+        # latest reading time returned in window mode
+        self._last_window_time = None
+
         # default sample time
         self.sample_time = None
 
@@ -96,7 +113,7 @@ class PicoLogAdc24(Adc):
         logger.debug("C library for unit loaded")
 
     def _get_hrdl_lib(self):
-        return ctypes.CDLL(self.config['picolog']['lib_path_adc24'])
+        return load_library(self.config['picolog']['lib_path_adc24'])
 
     def open(self):
         """Opens the PicoLog unit for communication"""
@@ -168,6 +185,9 @@ class PicoLogAdc24(Adc):
 
                 self.set_analog_in_channel(channel, True, vrange, itype)
 
+        # compute the conversion factors for the configured ranges
+        self.calibrate()
+
     def is_open(self):
         """Checks if the unit is open"""
         return self.handle is not None
@@ -202,7 +222,7 @@ class PicoLogAdc24(Adc):
 
         # get unit info, returning number of characters written to buffer
         length = self._hrdl_get_unit_info(self.handle,
-                                          ctypes.pointer(self._c_str_buf),
+                                          self._p_str_buf,
                                           self._c_str_buf_len,
                                           self._c_info_type)
 
@@ -361,6 +381,9 @@ class PicoLogAdc24(Adc):
         self.channel_voltages[channel] = vrange
         self.channel_types[channel] = itype
 
+        # the conversion factor depends on the range
+        self._invalidate_calibration(channel)
+
         logger.debug("Analog input channel %i set to enabled=%i, vrange=%i, "
                      "type=%i", channel, enabled, vrange, itype)
 
@@ -427,39 +450,86 @@ class PicoLogAdc24(Adc):
             status = self._hrdl_run(self.handle,
                                 self._c_sample_buf_len,
                                 self._c_sample_method)
-        elif (sample_method == SampleMethod.BLOCK):
+        elif sample_method in (SampleMethod.BLOCK, SampleMethod.WINDOW):
             # We only want sample_buf_len / num_channels, samples-per-channel
             # calculate number of values to collect for each channel
-            self._samples_per_channel = (ctypes.c_long(int(self.config['device']['sample_buf_len']) // len(self.enabled_channels)))
-            
+            self._c_num_samples.value = \
+                int(self.config['device']['sample_buf_len']) \
+                // len(self.enabled_channels)
+
             status = self._hrdl_run(self.handle,
-                                self._samples_per_channel,
+                                self._c_num_samples,
                                 self._c_sample_method)
         # check return status
         if not Status.is_valid_status(status):
             # run failure
             self.raise_unit_error()
 
+    def _start(self, sample_method):
+        """Runs the unit and saves the start time
+
+        :param sample_method: sampling method
+        """
+
+        # run
+        self._run(sample_method)
+
+        self.sample_method = sample_method
+
+        # save timestamp
+        self.stream_start_timestamp = int(round(time.time() * 1000))
+
     def stream(self):
         """Streams data from the unit"""
 
         logger.info("Starting unit streaming")
 
         # run stream
-        self._run(SampleMethod.STREAM)
-
-        # save timestamp
-        self.stream_start_timestamp = int(round(time.time() * 1000))
+        self._start(SampleMethod.STREAM)
 
     def block(self):
+        """Collects a block of samples from the unit
+
+        The unit collects as many samples as fit in the sample buffer, then
+        stops. Once the block is retrieved with :meth:`get_reading_block`, the
+        unit is run again to collect the next block.
+        """
 
         logger.info("Starting unit in BLOCK mode")
-        
-        # run
-        self._run(SampleMethod.BLOCK)
 
-        # save timestamp
-        self.stream_start_timestamp = int(round(time.time() * 1000))
+        self._start(SampleMethod.BLOCK)
+
+    def window(self):
+        """Collects samples continuously from the unit, retrieving the latest \
+        window of samples
+
+        Each retrieval returns the latest samples that fit in the sample
+        buffer. Samples already returned by a previous retrieval are dropped
+        by :meth:`get_reading_block`.
+        """
+
+        logger.info("Starting unit in WINDOW mode")
+
+        self._last_window_time = None
+
+        self._start(SampleMethod.WINDOW)
+
+    def start_sampling(self, sample_method="stream"):
+        """Starts sampling with the specified method
+
+        :param sample_method: "stream", "block" or "window"
+        :type sample_method: str
+        :raises ValueError: if the sample method is not recognised
+        """
+
+        if sample_method == "stream":
+            self.stream()
+        elif sample_method == "block":
+            self.block()
+        elif sample_method == "window":
+            self.window()
+        else:
+            raise ValueError("Unrecognised sample method")
 
     def get_readings(self):
         """Fetches uncollected ADC readings
@@ -468,96 +538,98 @@ class PicoLogAdc24(Adc):
         returns a list of readings, in chronological order.
         """
 
-        # get payload
-        (times, samples) = self._get_payload()
+        return self.get_reading_block().to_readings()
+
+    def get_reading_block(self):
+        """Fetches uncollected ADC readings as a block
 
-        # empty list of readings
-        readings = []
+        :return: readings, in chronological order
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        # start time of the payload's run
+        start_timestamp = self.stream_start_timestamp
 
-        # order the channels set
-        ordered_channels = sorted(self.enabled_channels)
+        # get payload
+        (times, samples) = self._get_payload()
 
-        # loop over times, adding readings
-        for reading_time, reading_data in zip(times, samples):
-            reading_time = int(reading_time)
-            reading_data = list(reading_data)
+        # convert times from ms since stream start to UNIX timestamps (in ms)
+        real_times = start_timestamp + times.astype(numpy.int64)
 
-            if not reading_data:
-                # empty data
-                break
+        if self.sample_method == SampleMethod.BLOCK:
+            # run the unit for the next block; the buffers are only written
+            # when that block is fetched, after this one is copied into the
+            # reading block
+            self._start(SampleMethod.BLOCK)
 
-            # convert time from ms since stream start to UNIX timestamp (in ms)
-            real_time = self.stream_start_timestamp + reading_time
+        if self.sample_method == SampleMethod.WINDOW:
+            # drop samples returned in previous windows
+            if self._last_window_time is not None:
+                new = real_times > self._last_window_time
+                real_times = real_times[new]
+                samples = samples[new]
 
-            readings.append(Reading(real_time, ordered_channels, reading_data))
+            if len(real_times):
+                self._last_window_time = int(real_times[-1])
 
-        return readings
+        return ReadingBlock(real_times, sorted(self.enabled_channels), samples)
 
     def _get_payload(self):
         """Fetches uncollected sample payload from the unit"""
 
         # calculate number of values to collect for each channel
-        samples_per_channel = int(self.config['device']['sample_buf_len']) \
-                            // len(self.enabled_channels)
+        self._c_num_samples.value = \
+            int(self.config['device']['sample_buf_len']) \
+            // len(self.enabled_channels)
 
         # get samples, without using the overflow short parameter (None == NULL)
         num_samples = self._hrdl_get_times_and_values(
             self.handle,
-            ctypes.pointer(self._c_sample_times),
-            ctypes.pointer(self._c_sample_values),
+            self._p_sample_times,
+            self._p_sample_values,
             None,
-            ctypes.c_long(samples_per_channel))
+            self._c_num_samples)
 
         # check return status
         if num_samples == 0:
             raise Exception("Call failed or no values available")
 
-        # convert times and values into Python lists
-        raw_times, raw_values = self._sample_lists(num_samples)
-
-        # empty lists for cleaned up times and samples
-        times = []
-        values = []
-
-        # number of active channels
-        channel_count = len(self.enabled_channels)
+        # wrap times and values buffers as arrays
+        times, values = self._sample_arrays(num_samples)
 
-        # loop over at least the first time and samples set (the first time can be zero,
-        # next entries cannot be)
-        for i, raw_time in enumerate(raw_times):
-            # break when first zero time after first is found
-            if i > 0 and raw_time == 0:
-                break
+        # the first time can be zero, but later ones cannot; the payload ends
+        # at the first zero time after the first
+        zero_times = numpy.flatnonzero(times[1:] == 0)
 
-            # add time to list
-            times.append(raw_time)
+        if len(zero_times):
+            times = times[:zero_times[0] + 1]
+            values = values[:zero_times[0] + 1]
 
-            # start index
-            i_start = i * channel_count
-
-            # end index
-            i_end = i_start + channel_count
+        return times, values
 
-            # add samples from each channel
-            values.append(raw_values[i_start:i_end])
+    def _sample_arrays(self, num_samples):
+        """Wraps the time and value C buffers as arrays
 
-        return times, values
+        The arrays are views of the C buffers, so they are only valid until the
+        next call to the unit.
 
-    def _sample_lists(self, num_samples):
-        """Converts time and value C buffers into Python lists"""
+        :param num_samples: number of samples per channel in the buffers
+        :type num_samples: int
+        :return: sample times and (time, channel) sample values
+        :rtype: Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+        """
 
         num_samples = int(num_samples)
 
-        # number of values in the time period, i.e. total samples times
-        # number of channels
-        num_values = num_samples * len(self.enabled_channels)
+        # number of active channels
+        channel_count = len(self.enabled_channels)
 
-        # convert to list and return
-        # NOTE: the conversion from c_long elements to ints is done by the slice operation
-        times = [int(i) for i in self._c_sample_times[:num_samples]]
-        values = [int(i) for i in self._c_sample_values[:num_values]]
+        times = numpy.frombuffer(self._c_sample_times, dtype=numpy.int32,
+                                 count=num_samples)
+        values = numpy.frombuffer(self._c_sample_values, dtype=numpy.int32,
+                                  count=num_samples * channel_count)
 
-        return times, values
+        return times, values.reshape(num_samples, channel_count)
 
     def get_enabled_channels_count(self):
         """Fetches the number of channels enabled in the unit
@@ -570,7 +642,7 @@ class PicoLogAdc24(Adc):
         # get enabled channel count
         status = self._hrdl_get_number_of_enabled_channels(
             self.handle,
-            ctypes.pointer(self._c_enabled_channels))
+            self._p_enabled_channels)
 
         # check return status
         if not Status.is_valid_status(status):
@@ -612,8 +684,8 @@ class PicoLogAdc24(Adc):
         # get minimum and maximum counts
         status = self._hrdl_get_min_max_adc_counts(
             self.handle,
-            ctypes.pointer(self._c_minimum_count),
-            ctypes.pointer(self._c_maximum_count),
+            self._p_minimum_count,
+            self._p_maximum_count,
             self._c_channel)
 
         # check return status
@@ -693,7 +765,23 @@ class PicoLogAdc24(Adc):
         return int(self.lib.HRDLSetMains(handle, sixty_hertz))
 
 class PicoLogAdc24Sim(PicoLogAdc24):
-    """Represents a simulated :class:`PicoLogAdc24` useful for testing"""
+    """Represents a simulated :class:`PicoLogAdc24` useful for testing
+
+    Fake samples are generated with numpy into a preallocated ring buffer
+    holding as many samples per channel as the unit's buffer, and copied into
+    the C buffers with :func:`ctypes.memmove`, so that the simulator can keep
+    up with short sample times. As with the hardware, samples not retrieved
+    before the buffer fills are lost.
+
+    Time is read from a clock, which by default runs at the ``speed`` set in
+    the ``[simulator]`` config section, so the simulator can run faster than
+    real time. Each channel's values are generated by the waveform set by the
+    section's ``channel_<n>_waveform`` option, or its ``waveform`` option by
+    default, using a random generator for each channel derived from the
+    section's ``seed``. With a fixed seed and a
+    :class:`~datalog.adc.simulation.ManualClock`, or the same poll times, the
+    generated samples are reproducible.
+    """
     # maximum string buffer (guess)
     MAX_BUF_LEN = 2 ** 32 / 2 - 1
 
@@ -704,16 +792,65 @@ class PicoLogAdc24Sim(PicoLogAdc24):
     MIN_COUNT = 0
     MAX_COUNT = 2 ** 24 - 1
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, clock=None, **kwargs):
+        """Instantiate a PicoLogAdc24Sim
+
+        :param config: configuration object
+        :type config: :class:`~datalog.adc.config`
+        :param clock: object with a ``time`` method returning the time in s \
+        since the epoch, or None to create a \
+        :class:`~datalog.adc.simulation.ScaledClock` running at the \
+        configured speed
+        """
+
         # call parent
         super(PicoLogAdc24Sim, self).__init__(*args, **kwargs)
 
+        sim_config = self._get_sim_config()
+
+        if clock is None:
+            clock = ScaledClock(sim_config.get('speed', '1'))
+
+        self.clock = clock
+
+        seed = sim_config.get('seed', '').strip()
+        self.seed = int(seed) if seed else None
+
         # fake enabled channels
         self._fake_enabled_channels = set([])
 
-        # fake samples buffers
-        self._fake_samples_time_buf = []
-        self._fake_samples_value_buf = []
+        # fake sample ring buffer, allocated when the unit is run
+        self._fake_times = None
+        self._fake_values = None
+
+        # numbers of fake samples written to and read from the ring buffer
+        self._fake_written = 0
+        self._fake_read = 0
+
+        # number of fake samples lost because the ring buffer was full
+        self.fake_overruns = 0
+
+        # fake sample waveforms and random generators, by channel
+        self._waveforms = {}
+        self._fake_rngs = {}
+
+        default_waveform = sim_config.get('waveform', 'uniform')
+
+        # one generator per channel, so that each channel's values do not
+        # depend on which other channels are enabled
+        seed_sequences = numpy.random.SeedSequence(self.seed).spawn(
+            self.NUM_CHANNELS)
+
+        for channel in range(1, self.NUM_CHANNELS + 1):
+            waveform = sim_config.get('channel_{0}_waveform'.format(channel),
+                                      default_waveform)
+
+            self._waveforms[channel] = get_waveform(waveform)
+            self._fake_rngs[channel] = numpy.random.default_rng(
+                seed_sequences[channel - 1])
+
+        # fake sample method, set when the unit is run
+        self._fake_method = None
 
         # fake request time
         self._last_fake_request_time = None
@@ -728,6 +865,24 @@ class PicoLogAdc24Sim(PicoLogAdc24):
         # no library to load
         return None
 
+    def _get_sim_config(self):
+        """Gets the simulator config section, or an empty dict if there is \
+        none"""
+
+        if self.config.has_section('simulator'):
+            return self.config['simulator']
+
+        return {}
+
+    def _get_fake_time(self):
+        """Gets the simulated time
+
+        :return: time in ms since the epoch
+        :rtype: int
+        """
+
+        return int(round(self.clock.time() * 1000))
+
     def _generate_fake_samples(self):
         """Generates fake samples to cover the time since the last data \
         retrieval"""
@@ -739,7 +894,7 @@ class PicoLogAdc24Sim(PicoLogAdc24):
         start_offset = last_request_time - self.stream_start_timestamp
 
         # current time
-        current_time = int(round(time.time() * 1000))
+        current_time = self._get_fake_time()
 
         # time since last call
         elapsed_time = current_time - last_request_time
@@ -750,20 +905,105 @@ class PicoLogAdc24Sim(PicoLogAdc24):
         if num_samples == 0:
             return
 
-        # generate fake samples
-        self._fake_samples_time_buf.extend( \
-            [start_offset + self.sample_time * t for t in range(num_samples)])
-        self._fake_samples_value_buf.extend( \
-            [[int(random.uniform(self.MIN_COUNT, self.MAX_COUNT)) for i in \
-            range(len(self.enabled_channels))] for j in range(num_samples)])
-
         # reset stopwatch
         self._last_fake_request_time = last_request_time \
                                     + num_samples * self.sample_time
 
-    def stream(self):
+        capacity = len(self._fake_times)
+
+        if self._fake_method == SampleMethod.BLOCK:
+            # the unit stops once the block is full
+            num_samples = min(num_samples, capacity - self._fake_written)
+
+            if num_samples <= 0:
+                return
+
+        # only the latest samples fit in the buffer
+        skipped = max(num_samples - capacity, 0)
+        num_samples -= skipped
+
+        # generate fake samples
+        times = start_offset + self.sample_time \
+                * numpy.arange(skipped, skipped + num_samples)
+        values = numpy.zeros((num_samples, self._fake_values.shape[1]))
+
+        for column, channel in enumerate(sorted(self.enabled_channels)):
+            values[:, column] = self._waveforms[channel].generate(
+                times, self.sample_time, self._fake_rngs[channel])
+
+        # counts are whole numbers within the ADC range
+        values = numpy.clip(numpy.round(values), self.MIN_COUNT,
+                            self.MAX_COUNT).astype(numpy.int32)
+
+        self._write_fake_samples(times, values)
+
+        # unretrieved samples overwritten
+        lost = skipped + max(self._fake_written - self._fake_read - capacity,
+                             0)
+
+        if self._fake_method == SampleMethod.WINDOW:
+            # samples are expected to be overwritten in window mode
+            lost = 0
+
+        if lost:
+            logger.warning("Fake buffer full: %i samples lost", lost)
+            self.fake_overruns += lost
+            self._fake_read = max(self._fake_read,
+                                  self._fake_written - capacity)
+
+    def _allocate_fake_buffer(self, samples_per_channel):
+        """Allocates the fake sample ring buffer
+
+        :param samples_per_channel: number of samples per channel to hold
+        :type samples_per_channel: int
+        """
+
+        n_channels = max(len(self.enabled_channels), 1)
+
+        self._fake_times = numpy.zeros(max(samples_per_channel, 1),
+                                       dtype=numpy.int32)
+        self._fake_values = numpy.zeros((len(self._fake_times), n_channels),
+                                        dtype=numpy.int32)
+        self._fake_written = 0
+        self._fake_read = 0
+
+    def _fake_slices(self, start, stop):
+        """Maps a range of fake sample numbers onto ring buffer slices
+
+        :return: ring buffer slices, in order
+        :rtype: List[slice]
+        """
+
+        capacity = len(self._fake_times)
+        first = start % capacity
+        length = stop - start
+
+        if first + length <= capacity:
+            return [slice(first, first + length)]
+
+        return [slice(first, capacity), slice(0, first + length - capacity)]
+
+    def _write_fake_samples(self, times, values):
+        """Writes fake samples into the ring buffer, with at most one \
+        wraparound"""
+
+        position = 0
+
+        for part in self._fake_slices(self._fake_written,
+                                      self._fake_written + len(times)):
+            length = part.stop - part.start
+            self._fake_times[part] = times[position:position + length]
+            self._fake_values[part] = values[position:position + length]
+            position += length
+
+        self._fake_written += len(times)
+
+    def _start(self, sample_method):
         # call parent
-        super(PicoLogAdc24Sim, self).stream()
+        super(PicoLogAdc24Sim, self)._start(sample_method)
+
+        # use the simulated time
+        self.stream_start_timestamp = self._get_fake_time()
 
         # set the time to use for readings
         self._last_fake_request_time = self.stream_start_timestamp
@@ -783,7 +1023,12 @@ class PicoLogAdc24Sim(PicoLogAdc24):
         # generate fake samples
         self._generate_fake_samples()
 
-        if self._fake_samples_time_buf:
+        if self._fake_method != SampleMethod.STREAM \
+            and self._fake_written < len(self._fake_times):
+            # block and window readings are ready once the buffer has filled
+            return 0
+
+        if self._fake_written > self._fake_read:
             return 1
 
         return 0
@@ -899,10 +1144,6 @@ class PicoLogAdc24Sim(PicoLogAdc24):
             self._settings_error_code = SettingsError.INVALID_PARAMETER
             return 0
 
-        # temporary: only support stream
-        if sample_method is not SampleMethod.STREAM:
-            raise Exception("Only streaming sample method currently supported")
-
         sample_buf_len = int(sample_buf_len.value)
 
         if sample_buf_len > self.MAX_BUF_LEN:
@@ -910,6 +1151,16 @@ class PicoLogAdc24Sim(PicoLogAdc24):
             self._settings_error_code = SettingsError.INVALID_PARAMETER
             return 0
 
+        if sample_method == SampleMethod.STREAM:
+            # the unit buffer holds the values of all channels
+            self._allocate_fake_buffer(sample_buf_len
+                                       // max(len(self.enabled_channels), 1))
+        else:
+            # block and window lengths are in samples per channel
+            self._allocate_fake_buffer(sample_buf_len)
+
+        self._fake_method = sample_method
+
         # success
         self._settings_error_code = SettingsError.OK
         return 1
@@ -917,36 +1168,40 @@ class PicoLogAdc24Sim(PicoLogAdc24):
     def _hrdl_get_times_and_values(self, handle, pnt_sample_times,
                                    pnt_sample_values, pnt_overflow,
                                    samples_per_channel):
-        # copy the fake samples and times
-        times = list(self._fake_samples_time_buf)
-        values = list(self._fake_samples_value_buf)
-
         samples_per_channel = int(samples_per_channel.value)
 
-        # number of channels
-        n_channels = len(self.enabled_channels)
-
-        # number of samples, either the requested amount or the length of the
-        # list
-        n_times = len(times)
-        if samples_per_channel > n_times:
-            samples_per_channel = n_times
-
-        sample_count = 0
-        for i in range(samples_per_channel):
-            # set sample time directly in the array
-            self._c_sample_times[i] = ctypes.c_int32(times[i])
-            for j in range(n_channels):
-                idx = n_channels * i + j
-                # set sample value directly in the array
-                self._c_sample_values[idx] = values[i][j]
-
-            # increment sample counter
-            sample_count += 1
-
-        # reset buffers
-        self._fake_samples_time_buf = self._fake_samples_time_buf[samples_per_channel:]
-        self._fake_samples_value_buf = self._fake_samples_value_buf[idx+1:]
+        if self._fake_method == SampleMethod.WINDOW:
+            # the latest samples, whether or not previously retrieved
+            self._fake_read = self._fake_written - min(
+                samples_per_channel, self._fake_written, len(self._fake_times))
+
+        # number of samples, either the requested amount or the number
+        # available
+        sample_count = min(samples_per_channel,
+                           self._fake_written - self._fake_read)
+
+        n_channels = self._fake_values.shape[1]
+
+        # addresses of the C buffers
+        times_address = ctypes.cast(pnt_sample_times, ctypes.c_void_p).value
+        values_address = ctypes.cast(pnt_sample_values, ctypes.c_void_p).value
+
+        # copy into the C buffers in one or two bulk copies
+        position = 0
+
+        for part in self._fake_slices(self._fake_read,
+                                      self._fake_read + sample_count):
+            length = part.stop - part.start
+
+            ctypes.memmove(times_address + 4 * position,
+                           self._fake_times[part].ctypes.data, 4 * length)
+            ctypes.memmove(values_address + 4 * n_channels * position,
+                           self._fake_values[part].ctypes.data,
+                           4 * n_channels * length)
+
+            position += length
+
+        self._fake_read += sample_count
 
         return sample_count
 
@@ -0,0 +1,336 @@
+"""Acquisition from several ADC units"""
+
+import time
+import logging
+import threading
+from configparser import ConfigParser
+from contextlib import contextmanager, ExitStack
+
+import numpy
+
+from datalog.data import ReadingBlock
+from .adc import Adc
+
+# logger
+logger = logging.getLogger("datalog.orchestrator")
+
+
+class Orchestrator(object):
+    """Class to retrieve readings from several ADCs in parallel and merge them \
+    into one datastore
+
+    Each ADC is polled by its own :class:`~datalog.adc.fetch.Retriever`. Reading
+    times, which each unit derives from its own ``stream_start_timestamp``, are
+    rounded to the nearest multiple of the common sample time, and readings
+    from all units for the same rounded time are merged into one reading.
+
+    Merged readings are only stored once every unit has provided readings up
+    to that time, or once they are ``max_lag`` ms older than the latest
+    reading from any unit. Values missing from a unit are stored as NaN. The
+    merged datastore's channels are numbered sequentially; use
+    :meth:`get_merged_channel` and :attr:`channel_keys` to map between these
+    and (device, channel) pairs.
+    """
+
+    def __init__(self, adcs, datastore, max_lag=None):
+        """Initialises the orchestrator
+
+        :param adcs: ADCs to retrieve readings from, by device name
+        :type adcs: Dict[str, :class:`~datalog.adc.adc.Adc`]
+        :param datastore: the datastore to store merged readings in
+        :type datastore: :class:`~datalog.data.DataStore`
+        :param max_lag: time in ms after which readings are stored without \
+        waiting for lagging units, or None to always wait
+        :type max_lag: int
+        :raises ValueError: if no ADCs are specified or their sample times \
+        differ
+        """
+
+        if not adcs:
+            raise ValueError("No ADCs specified")
+
+        self.adcs = dict(adcs)
+        self.datastore = datastore
+
+        if max_lag is not None:
+            max_lag = int(max_lag)
+
+        self.max_lag = max_lag
+
+        sample_times = set([int(adc.config['device']['sample_time'])
+                            for adc in self.adcs.values()])
+
+        if len(sample_times) != 1:
+            raise ValueError("ADC sample times must be the same")
+
+        self.sample_time = sample_times.pop()
+
+        # (device, channel) of each merged channel, set once ADCs are configured
+        self.channel_keys = None
+
+        # latest rounded reading time from each device
+        self._latest_times = {name: None for name in self.adcs}
+
+        # readings waiting for lagging devices, by device
+        self._pending = {}
+
+        # latest stored reading time
+        self._last_stored_time = None
+
+        # number of readings discarded for arriving after their time was stored
+        self.late_readings = 0
+
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load_from_config(cls, config, datastore):
+        """Creates an orchestrator for the devices listed in the config
+
+        The ``[devices]`` section's ``names`` option lists device names,
+        separated by commas. Each device uses the other config sections, with
+        options overridden by those in sections named ``<name>:<section>``,
+        e.g. ``[unit1:picolog]``.
+
+        :param config: dict-like config object
+        :param datastore: the datastore to store merged readings in
+        :type datastore: :class:`~datalog.data.DataStore`
+        """
+
+        names = [name.strip()
+                 for name in config['devices']['names'].split(",")
+                 if name.strip()]
+
+        adcs = {name: Adc.load_from_config(cls.get_device_config(config, name))
+                for name in names}
+
+        max_lag = config['devices'].get('max_lag')
+
+        return cls(adcs, datastore, max_lag)
+
+    @staticmethod
+    def get_device_config(config, name):
+        """Creates the config for the specified device
+
+        :param config: dict-like config object
+        :param name: device name
+        :type name: str
+        :return: device config
+        :rtype: :class:`~configparser.ConfigParser`
+        """
+
+        device_config = ConfigParser()
+
+        prefix = "{0}:".format(name)
+
+        for section in config.sections():
+            if ":" in section:
+                continue
+
+            device_config[section] = dict(config[section])
+
+            # apply device overrides
+            if config.has_section(prefix + section):
+                device_config[section].update(config[prefix + section])
+
+        return device_config
+
+    @contextmanager
+    def get_retrievers(self):
+        """Opens and configures each ADC and retrieves readings from them in \
+        parallel
+
+        :return: retrievers, by device name
+        :rtype: Dict[str, :class:`~datalog.adc.fetch.Retriever`]
+        """
+
+        with ExitStack() as stack:
+            retrievers = {}
+
+            for name, adc in self.adcs.items():
+                retrievers[name] = stack.enter_context(
+                    adc.get_retriever(_DeviceSink(self, name)))
+
+            # all devices are now configured, so the merged channels are known
+            with self._lock:
+                self.channel_keys = [(name, channel)
+                                     for name, adc in self.adcs.items()
+                                     for channel in sorted(adc.enabled_channels)]
+
+                self._store_merged()
+
+            yield retrievers
+
+    def get_merged_channel(self, device, channel):
+        """Gets the merged datastore channel for the specified device channel
+
+        :param device: device name
+        :type device: str
+        :param channel: device channel
+        :type channel: int
+        :return: merged channel
+        :rtype: int
+        :raises ValueError: if the device channel is not enabled
+        """
+
+        try:
+            return self.channel_keys.index((device, int(channel))) + 1
+        except (AttributeError, ValueError):
+            raise ValueError("Channel {0} of device {1} is not "
+                             "enabled".format(channel, device))
+
+    def get_lags(self):
+        """Gets the time each device's latest reading is behind the latest \
+        reading from any device
+
+        :return: lag in ms, or None if the device has not provided readings, \
+        by device name
+        :rtype: Dict[str, int]
+        """
+
+        with self._lock:
+            latest = self._get_newest_time()
+
+            return {name: None if device_time is None else latest - device_time
+                    for name, device_time in self._latest_times.items()}
+
+    def get_ages(self):
+        """Gets the time since each device's latest reading
+
+        :return: age in ms, or None if the device has not provided readings, \
+        by device name
+        :rtype: Dict[str, int]
+        """
+
+        now = int(round(time.time() * 1000))
+
+        with self._lock:
+            return {name: None if device_time is None else now - device_time
+                    for name, device_time in self._latest_times.items()}
+
+    def add(self, device, block):
+        """Adds readings from the specified device, storing merged readings \
+        once all devices have provided them
+
+        :param device: device name
+        :type device: str
+        :param block: readings
+        :type block: :class:`~datalog.data.ReadingBlock`
+        """
+
+        # round times to the common sample grid
+        times = (block.reading_times + self.sample_time // 2) \
+                // self.sample_time * self.sample_time
+
+        # keep one reading per rounded time
+        times, indices = numpy.unique(times, return_index=True)
+        values = block.values[indices]
+
+        with self._lock:
+            if self._last_stored_time is not None:
+                # discard readings for times already stored
+                late = times <= self._last_stored_time
+
+                if late.any():
+                    self.late_readings += int(late.sum())
+                    logger.warning("Discarded %i late readings from %s",
+                                   late.sum(), device)
+
+                    times = times[~late]
+                    values = values[~late]
+
+            if not len(times):
+                return
+
+            if device in self._pending:
+                pending_times, pending_values = self._pending[device]
+                times = numpy.concatenate([pending_times, times])
+                values = numpy.concatenate([pending_values, values])
+
+            self._pending[device] = (times, values)
+            self._latest_times[device] = int(times[-1])
+
+            self._store_merged()
+
+    def _get_newest_time(self):
+        """Gets the latest reading time from any device, or None if no device \
+        has provided readings"""
+
+        times = [device_time for device_time in self._latest_times.values()
+                 if device_time is not None]
+
+        if not times:
+            return None
+
+        return max(times)
+
+    def _store_merged(self):
+        """Stores merged readings up to the time all devices have reached"""
+
+        newest_time = self._get_newest_time()
+
+        # wait until all devices are configured and one has provided readings
+        if self.channel_keys is None or newest_time is None:
+            return
+
+        if None in self._latest_times.values():
+            stored_time = None
+        else:
+            stored_time = min(self._latest_times.values())
+
+        # don't wait for lagging devices beyond the maximum lag
+        if self.max_lag is not None and (stored_time is None or
+                                         stored_time < newest_time
+                                         - self.max_lag):
+            stored_time = newest_time - self.max_lag
+
+        if stored_time is None:
+            return
+
+        # times to store
+        merged_times = numpy.unique(numpy.concatenate(
+            [times[times <= stored_time]
+             for times, _ in self._pending.values()]))
+
+        if not len(merged_times):
+            return
+
+        merged_values = numpy.full((len(merged_times), len(self.channel_keys)),
+                                   numpy.nan)
+
+        # fill the merged values from each device's readings
+        column = 0
+
+        for name, adc in self.adcs.items():
+            n_channels = len(adc.enabled_channels)
+
+            if name in self._pending:
+                times, values = self._pending[name]
+                count = numpy.searchsorted(times, stored_time, side="right")
+
+                rows = numpy.searchsorted(merged_times, times[:count])
+                merged_values[rows, column:column + n_channels] = values[:count]
+
+                self._pending[name] = (times[count:], values[count:])
+
+            column += n_channels
+
+        self._last_stored_time = int(merged_times[-1])
+
+        self.datastore.insert(ReadingBlock(merged_times,
+                                           range(1, len(self.channel_keys) + 1),
+                                           merged_values))
+
+
+class _DeviceSink(object):
+    """Receives readings from one device's retriever on behalf of an \
+    :class:`Orchestrator`"""
+
+    def __init__(self, orchestrator, device):
+        self.orchestrator = orchestrator
+        self.device = device
+
+    def insert(self, readings):
+        if not isinstance(readings, ReadingBlock):
+            readings = ReadingBlock.instance_from_readings(readings)
+
+        self.orchestrator.add(self.device, readings)
@@ -0,0 +1,162 @@
+"""Data retrieval from an ADC unit in a separate process"""
+
+import logging
+import multiprocessing
+from configparser import ConfigParser
+
+from datalog.shared import SharedRingBuffer
+from .adc import Adc
+
+# logger
+logger = logging.getLogger("datalog.process")
+
+
+class ProcessRetriever(object):
+    """Class to run an ADC and its retriever in a child process, writing \
+    readings into a shared memory ring buffer
+
+    This isolates acquisition from work in the parent process, which then
+    cannot delay polls. The buffer can be read with :meth:`reader`, or from
+    other processes by attaching to :attr:`name` with
+    :meth:`~datalog.shared.SharedRingBuffer.attach`.
+    """
+
+    # default number of readings held in the ring buffer
+    DEFAULT_CAPACITY = 100000
+
+    # default maximum number of channels per reading
+    DEFAULT_MAX_CHANNELS = 16
+
+    # time to wait for the child process to start, in s
+    START_TIMEOUT = 30
+
+    def __init__(self, config, capacity=None, max_channels=None):
+        """Initialises the retriever
+
+        :param config: dict-like config object
+        :param capacity: number of readings to hold in the ring buffer
+        :type capacity: int
+        :param max_channels: maximum number of channels per reading
+        :type max_channels: int
+        """
+
+        if capacity is None:
+            capacity = self.DEFAULT_CAPACITY
+
+        if max_channels is None:
+            max_channels = self.DEFAULT_MAX_CHANNELS
+
+        # config sections, to recreate the config in the child process
+        self._config_sections = {section: dict(config[section])
+                                 for section in config.sections()}
+
+        self.ring = SharedRingBuffer.create(capacity, max_channels)
+
+        self._stop_event = multiprocessing.Event()
+        self._process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def name(self):
+        """Shared memory name of the ring buffer"""
+        return self.ring.name
+
+    def start(self):
+        """Starts the child process and waits for it to start retrieving
+
+        :raises Exception: if the child process failed to start retrieving
+        """
+
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+
+        self._process = multiprocessing.Process(
+            target=_run_retriever,
+            args=(self._config_sections, self.ring.name, self._stop_event,
+                  child_conn),
+            name="datalog-retriever", daemon=True)
+        self._process.start()
+
+        child_conn.close()
+
+        # wait for the child to report that it has started
+        if not parent_conn.poll(self.START_TIMEOUT):
+            self.stop()
+            raise Exception("Retriever process did not start")
+
+        error = parent_conn.recv()
+
+        if error is not None:
+            self.stop()
+            raise Exception("Retriever process failed: {0}".format(error))
+
+        logger.info("Retriever process started with pid %i",
+                    self._process.pid)
+
+    def stop(self):
+        """Stops the child process and destroys the ring buffer"""
+
+        self._stop_event.set()
+
+        if self._process is not None:
+            logger.debug("Waiting for retriever process to stop")
+            self._process.join()
+            self._process = None
+            logger.info("Retriever process stopped")
+
+        if self.ring is not None:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
+
+    def is_alive(self):
+        """Checks if the child process is running"""
+        return self._process is not None and self._process.is_alive()
+
+    def reader(self, from_start=False):
+        """Creates a reader for the ring buffer
+
+        :param from_start: read from the oldest held reading rather than only \
+        readings written from now on
+        :type from_start: bool
+        :rtype: :class:`~datalog.shared.SharedRingReader`
+        """
+
+        return self.ring.reader(from_start)
+
+
+def _run_retriever(config_sections, name, stop_event, conn):
+    """Runs an ADC and its retriever, writing readings into the named ring \
+    buffer until the stop event is set"""
+
+    config = ConfigParser()
+    config.read_dict(config_sections)
+
+    ring = SharedRingBuffer.attach(name)
+
+    try:
+        adc = Adc.load_from_config(config)
+
+        with adc.get_retriever(ring):
+            # the ADC is now configured
+            ring.set_channels(sorted(adc.enabled_channels))
+
+            conn.send(None)
+
+            stop_event.wait()
+    except Exception as e:
+        logger.exception("Retriever process failed")
+
+        # report the error if the parent is still waiting to start
+        try:
+            conn.send(repr(e))
+        except OSError:
+            pass
+    finally:
+        conn.close()
+        ring.close()
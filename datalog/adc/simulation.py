@@ -0,0 +1,276 @@
+"""Clocks and waveforms for simulated ADCs
+
+A simulated ADC reads the time from a clock, so that it can run faster than
+real time with a :class:`ScaledClock`, or be stepped explicitly with a
+:class:`ManualClock`. Each channel's sample values are generated by a
+:class:`Waveform`, from the sample times and a random generator seeded per
+channel, so that a simulation with a fixed seed and clock is reproducible.
+
+Waveforms can be specified in config files as a name followed by parameters,
+e.g. ``sine:amplitude=100000,period=60000``. See :func:`get_waveform`.
+"""
+
+import abc
+import csv
+import time
+import logging
+
+import numpy
+
+# logger
+logger = logging.getLogger("datalog.simulation")
+
+
+class ScaledClock(object):
+    """Clock running at a multiple of real time
+
+    The clock starts at the current time, then advances ``speed`` times as fast
+    as the monotonic clock, so it neither drifts nor follows steps in the
+    system time.
+    """
+
+    def __init__(self, speed=1, start=None):
+        """Initialises the clock
+
+        :param speed: rate of the clock relative to real time
+        :type speed: float
+        :param start: time to start at, in s since the epoch, or None for the \
+        current time
+        :type start: float
+        """
+
+        speed = float(speed)
+
+        if speed <= 0:
+            raise ValueError("Clock speed must be positive")
+
+        if start is None:
+            start = time.time()
+
+        self.speed = speed
+        self.start = float(start)
+
+        self._monotonic_start = time.monotonic()
+
+    def time(self):
+        """Current time of the clock, in s since the epoch"""
+        return self.start + (time.monotonic() - self._monotonic_start) \
+               * self.speed
+
+
+class ManualClock(object):
+    """Clock that only advances when told to"""
+
+    def __init__(self, start=0):
+        """Initialises the clock
+
+        :param start: time to start at, in s since the epoch
+        :type start: float
+        """
+
+        self._time = float(start)
+
+    def time(self):
+        """Current time of the clock, in s since the epoch"""
+        return self._time
+
+    def advance(self, seconds):
+        """Advances the clock
+
+        :param seconds: time to advance by, in s
+        :type seconds: float
+        """
+
+        if seconds < 0:
+            raise ValueError("Clock cannot go backwards")
+
+        self._time += seconds
+
+
+class Waveform(object, metaclass=abc.ABCMeta):
+    """Base class of generators of simulated sample values"""
+
+    @abc.abstractmethod
+    def generate(self, times, sample_time, rng):
+        """Generates sample values for the specified times
+
+        :param times: sample times, in ms since the stream started
+        :type times: :class:`numpy.ndarray`
+        :param sample_time: time between samples, in ms
+        :type sample_time: int
+        :param rng: random generator for this channel
+        :type rng: :class:`numpy.random.Generator`
+        :return: sample values, in ADC counts
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        return NotImplemented
+
+
+class UniformWaveform(Waveform):
+    """Values drawn uniformly between two counts"""
+
+    def __init__(self, low=0, high=2 ** 24 - 1):
+        self.low = float(low)
+        self.high = float(high)
+
+    def generate(self, times, sample_time, rng):
+        return rng.uniform(self.low, self.high, len(times))
+
+
+class NoiseWaveform(Waveform):
+    """Normally distributed values around an offset"""
+
+    def __init__(self, sigma=1000, offset=2 ** 23):
+        self.sigma = float(sigma)
+        self.offset = float(offset)
+
+    def generate(self, times, sample_time, rng):
+        return self.offset + self.sigma * rng.standard_normal(len(times))
+
+
+class SineWaveform(Waveform):
+    """Sine wave around an offset"""
+
+    def __init__(self, amplitude=2 ** 22, period=60000, offset=2 ** 23,
+                 phase=0):
+        """Initialises the waveform
+
+        :param amplitude: amplitude, in counts
+        :param period: period, in ms
+        :param offset: mean value, in counts
+        :param phase: phase at the stream start, in radians
+        """
+
+        self.amplitude = float(amplitude)
+        self.period = float(period)
+        self.offset = float(offset)
+        self.phase = float(phase)
+
+    def generate(self, times, sample_time, rng):
+        return self.offset + self.amplitude \
+               * numpy.sin(2 * numpy.pi * times / self.period + self.phase)
+
+
+class DriftWaveform(Waveform):
+    """Values changing at a constant rate"""
+
+    def __init__(self, rate=10, offset=2 ** 23):
+        """Initialises the waveform
+
+        :param rate: rate of change, in counts per s
+        :param offset: value at the stream start, in counts
+        """
+
+        self.rate = float(rate)
+        self.offset = float(offset)
+
+    def generate(self, times, sample_time, rng):
+        return self.offset + self.rate * times / 1000
+
+
+class StepWaveform(Waveform):
+    """Values alternating between two levels"""
+
+    def __init__(self, low=2 ** 22, high=3 * 2 ** 22, period=60000, duty=0.5):
+        """Initialises the waveform
+
+        :param low: low level, in counts
+        :param high: high level, in counts
+        :param period: period, in ms
+        :param duty: fraction of each period at the high level
+        """
+
+        self.low = float(low)
+        self.high = float(high)
+        self.period = float(period)
+        self.duty = float(duty)
+
+    def generate(self, times, sample_time, rng):
+        high = (times % self.period) < self.duty * self.period
+
+        return numpy.where(high, self.high, self.low)
+
+
+class ReplayWaveform(Waveform):
+    """Values replayed from a column of a CSV file, in a loop
+
+    Each row gives the value of one sample, so the file is replayed at the
+    sample rate.
+    """
+
+    def __init__(self, path, column=1):
+        """Initialises the waveform
+
+        :param path: path to CSV file, e.g. exported readings
+        :type path: str
+        :param column: index of the column holding the values
+        :type column: int
+        :raises ValueError: if the file holds no values
+        """
+
+        column = int(column)
+
+        with open(path, newline="") as obj:
+            values = [float(row[column]) for row in csv.reader(obj)
+                      if len(row) > column]
+
+        if not values:
+            raise ValueError("No values to replay in {0}".format(path))
+
+        self.path = path
+        self.values = numpy.array(values)
+
+    def generate(self, times, sample_time, rng):
+        return self.values[times // sample_time % len(self.values)]
+
+
+# waveforms by name
+WAVEFORMS = {
+    "uniform": UniformWaveform,
+    "noise": NoiseWaveform,
+    "sine": SineWaveform,
+    "drift": DriftWaveform,
+    "step": StepWaveform,
+    "replay": ReplayWaveform
+}
+
+
+def get_waveform(waveform_str):
+    """Creates a waveform from the specified string
+
+    The string is a waveform name, optionally followed by a colon and
+    comma-separated parameters, e.g. ``sine:amplitude=1000,period=5000`` or
+    ``replay:path=data.csv,column=2``.
+
+    :param waveform_str: waveform string
+    :type waveform_str: str
+    :rtype: :class:`Waveform`
+    :raises ValueError: if the string is not valid
+    """
+
+    name, _, parameter_str = waveform_str.partition(":")
+    name = name.strip()
+
+    if name not in WAVEFORMS:
+        raise ValueError("Unrecognised waveform: {0}".format(name))
+
+    parameters = {}
+
+    for parameter in parameter_str.split(","):
+        if not parameter.strip():
+            continue
+
+        key, separator, value = parameter.partition("=")
+
+        if not separator:
+            raise ValueError("Invalid waveform parameter: {0}".format(
+                parameter))
+
+        parameters[key.strip()] = value.strip()
+
+    try:
+        return WAVEFORMS[name](**parameters)
+    except TypeError as e:
+        raise ValueError("Invalid {0} waveform parameters: {1}".format(name,
+                                                                      e))
@@ -0,0 +1,720 @@
+"""Time-partitioned archive of readings
+
+An :class:`Archive` keeps readings in segment files, each holding the readings
+from one time partition, such as an hour or a day, of one
+:class:`RetentionTier`. The first tier holds raw readings, and further tiers
+hold aggregates of the raw readings at coarser resolutions. Each tier keeps its
+segments for its own retention time, e.g. raw readings for 7 days and 1 minute
+aggregates for a year.
+
+Readings in the current partition of each tier are held in memory. Once a
+reading from a later partition arrives, the partition is sealed: its readings
+are compressed and written to a segment file, with a header holding the
+partition, the reading count, the earliest and latest reading times and each
+channel's minimum and maximum values. Only headers are read when the archive
+is opened, so queries decompress only the segments overlapping the requested
+time range.
+"""
+
+import os
+import re
+import bisect
+import struct
+import logging
+import threading
+import zlib
+
+import numpy
+
+from datalog.data import ReadingBlock
+from datalog import codec
+
+# logger
+logger = logging.getLogger("datalog.archive")
+
+# duration units, in ms
+DURATION_UNITS = {
+    "ms": 1,
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+    "y": 365 * 24 * 60 * 60 * 1000
+}
+
+
+def parse_duration(duration):
+    """Parses a duration such as "10s", "1m" or "7d"
+
+    :param duration: duration with a unit of ms, s, m, h, d, w or y, or an \
+    integer number of ms
+    :type duration: str or int
+    :return: duration, in ms
+    :rtype: int
+    :raises ValueError: if the duration is not valid
+    """
+
+    if isinstance(duration, int):
+        return duration
+
+    match = re.fullmatch(r"\s*(\d+)\s*(ms|s|m|h|d|w|y)?\s*", str(duration))
+
+    if match is None:
+        raise ValueError("Invalid duration: {0}".format(duration))
+
+    return int(match.group(1)) * DURATION_UNITS[match.group(2) or "ms"]
+
+
+class RetentionTier(object):
+    """Resolution and retention time of one level of an :class:`Archive`"""
+
+    def __init__(self, resolution=None, retention=None, partition=None):
+        """Initialises the tier
+
+        :param resolution: time in ms over which readings are averaged, or \
+        None for raw readings
+        :type resolution: int or str
+        :param retention: time in ms to keep readings for, or None to keep \
+        them forever
+        :type retention: int or str
+        :param partition: time in ms spanned by each segment file, or None to \
+        use the archive's partition
+        :type partition: int or str
+        :raises ValueError: if a time is not positive
+        """
+
+        if resolution is not None:
+            resolution = parse_duration(resolution)
+
+            if resolution <= 0:
+                raise ValueError("Resolution must be positive")
+
+        if retention is not None:
+            retention = parse_duration(retention)
+
+            if retention <= 0:
+                raise ValueError("Retention time must be positive")
+
+        if partition is not None:
+            partition = parse_duration(partition)
+
+            if partition <= 0:
+                raise ValueError("Partition time must be positive")
+
+        self.resolution = resolution
+        self.retention = retention
+        self.partition = partition
+
+    def __repr__(self):
+        return "RetentionTier({0}, {1}, {2})".format(self.resolution,
+                                                     self.retention,
+                                                     self.partition)
+
+    @property
+    def name(self):
+        """Name of the tier, used as its directory name"""
+
+        if self.resolution is None:
+            return "raw"
+
+        return "{0}ms".format(self.resolution)
+
+    @classmethod
+    def instance_from_str(cls, tier_str):
+        """Returns a new tier from the specified string
+
+        The string contains the resolution, either "raw" or a duration, and
+        optionally the retention time, separated by a colon, e.g. "raw:7d" or
+        "1m:1y".
+
+        :param tier_str: tier string
+        :type tier_str: str
+        """
+
+        parts = [part.strip() for part in tier_str.split(":")]
+
+        if len(parts) > 2:
+            raise ValueError("Invalid retention tier: {0}".format(tier_str))
+
+        resolution = parts[0]
+
+        if resolution == "raw":
+            resolution = None
+
+        retention = parts[1] if len(parts) > 1 and parts[1] else None
+
+        return cls(resolution, retention)
+
+
+class ArchiveSegment(object):
+    """Segment file holding the readings of one partition of one tier
+
+    The file is a header, then the channels as little-endian int32 and each
+    channel's minimum and maximum values as little-endian float64, then the
+    compressed reading times and sample values. Only the header is read when
+    the segment is opened; the readings are decompressed by :meth:`load`.
+
+    Segments are written with :mod:`~datalog.codec` delta encoding followed by
+    zlib compression. Segments holding zlib-compressed raw arrays can still be
+    read.
+    """
+
+    # header: identifier, encoding, partition start time, earliest and latest
+    # reading times, number of readings and number of channels
+    HEADER = struct.Struct("<4sB3xqqqII")
+    ID = b"DLA1"
+
+    # reading times and sample values as raw arrays, compressed with zlib
+    ENCODING_ZLIB = 0
+
+    # readings encoded with :func:`~datalog.codec.encode_block`, compressed
+    # with zlib
+    ENCODING_DELTA_ZLIB = 1
+
+    ENCODINGS = (ENCODING_ZLIB, ENCODING_DELTA_ZLIB)
+
+    # file name extension
+    EXTENSION = ".dla"
+
+    def __init__(self, path, encoding, start, min_time, max_time, count,
+                 channels, min_values, max_values, offset):
+        """Initialises the segment
+
+        Use :meth:`open` or :meth:`write` rather than calling this directly.
+        """
+
+        self.path = path
+        self.encoding = encoding
+        self.start = start
+        self.min_time = min_time
+        self.max_time = max_time
+        self.count = count
+        self.channels = channels
+        self.min_values = min_values
+        self.max_values = max_values
+
+        # position of the compressed readings in the file
+        self._offset = offset
+
+    def __repr__(self):
+        return "ArchiveSegment({0}, {1} readings from {2} to {3})".format(
+            self.path, self.count, self.min_time, self.max_time)
+
+    def overlaps(self, start=None, end=None):
+        """Checks if the segment holds readings in the half-open time range \
+        [start, end)
+
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :rtype: bool
+        """
+
+        return (start is None or self.max_time >= start) \
+               and (end is None or self.min_time < end)
+
+    @classmethod
+    def open(cls, path):
+        """Reads the header of a segment file
+
+        :param path: file path
+        :type path: str
+        :raises ValueError: if the file is not a segment file
+        """
+
+        with open(path, "rb") as obj:
+            data = obj.read(cls.HEADER.size)
+
+            if len(data) < cls.HEADER.size:
+                raise ValueError("{0} is not a segment file".format(path))
+
+            identifier, encoding, start, min_time, max_time, count, \
+            n_channels = cls.HEADER.unpack(data)
+
+            if identifier != cls.ID or encoding not in cls.ENCODINGS:
+                raise ValueError("{0} is not a segment file".format(path))
+
+            index = obj.read(20 * n_channels)
+
+        channels = numpy.frombuffer(index, dtype="<i4", count=n_channels)
+        limits = numpy.frombuffer(index, dtype="<f8", count=2 * n_channels,
+                                  offset=4 * n_channels)
+
+        return cls(path, encoding, start, min_time, max_time, count, channels.tolist(),
+                   limits[:n_channels], limits[n_channels:],
+                   cls.HEADER.size + 20 * n_channels)
+
+    @classmethod
+    def write(cls, path, start, block):
+        """Writes a segment file
+
+        :param path: file path
+        :type path: str
+        :param start: partition start time
+        :type start: int
+        :param block: readings, in chronological order
+        :type block: :class:`~datalog.data.ReadingBlock`
+        """
+
+        n_channels = len(block.channels)
+
+        # minimum and maximum values, ignoring NaN
+        min_values = numpy.fmin.reduce(block.values, axis=0)
+        max_values = numpy.fmax.reduce(block.values, axis=0)
+
+        header = b"".join([
+            cls.HEADER.pack(cls.ID, cls.ENCODING_DELTA_ZLIB, start,
+                            int(block.reading_times[0]),
+                            int(block.reading_times[-1]), len(block),
+                            n_channels),
+            numpy.array(block.channels, dtype="<i4").tobytes(),
+            min_values.astype("<f8").tobytes(),
+            max_values.astype("<f8").tobytes()
+        ])
+
+        payload = zlib.compress(codec.encode_block(block))
+
+        # replace any existing file only once the new one is complete
+        temp_path = path + ".tmp"
+
+        with open(temp_path, "wb") as obj:
+            obj.write(header)
+            obj.write(payload)
+
+        os.replace(temp_path, path)
+
+        return cls.open(path)
+
+    def load(self):
+        """Reads and decompresses the segment's readings
+
+        :return: readings
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        with open(self.path, "rb") as obj:
+            obj.seek(self._offset)
+            data = zlib.decompress(obj.read())
+
+        if self.encoding == self.ENCODING_DELTA_ZLIB:
+            return codec.decode_block(data)
+
+        n_channels = len(self.channels)
+
+        times = numpy.frombuffer(data, dtype="<i8", count=self.count)
+        values = numpy.frombuffer(data, dtype="<f8",
+                                  count=self.count * n_channels,
+                                  offset=8 * self.count)
+
+        return ReadingBlock(times, self.channels,
+                            values.reshape(self.count, n_channels))
+
+
+class Archive(object):
+    """Time-partitioned archive of readings with retention tiers
+
+    Readings are added with :meth:`add`, or from a
+    :class:`~datalog.data.DataStore` as they are inserted with :meth:`attach`.
+    """
+
+    # partition names, in ms
+    PARTITIONS = {
+        "hour": DURATION_UNITS["h"],
+        "day": DURATION_UNITS["d"]
+    }
+
+    def __init__(self, path, partition="hour", tiers=None):
+        """Initialises the archive, reading the headers of existing segments
+
+        :param path: directory to store segment files in
+        :type path: str
+        :param partition: time spanned by each segment file, as "hour", "day" \
+        or a duration
+        :type partition: str or int
+        :param tiers: retention tiers, or None for raw readings for 7 days and \
+        1 minute aggregates for a year, in daily files; the first tier must \
+        hold raw readings
+        :type tiers: List[:class:`RetentionTier`]
+        :raises ValueError: if the tiers are not valid
+        """
+
+        partition = self.PARTITIONS.get(partition, partition)
+
+        if tiers is None:
+            tiers = [RetentionTier(None, "7d"),
+                     RetentionTier("1m", "1y", "1d")]
+
+        tiers = list(tiers)
+
+        if not tiers or tiers[0].resolution is not None:
+            raise ValueError("The first tier must hold raw readings")
+
+        self.path = path
+        self.partition = parse_duration(partition)
+        self.tiers = tiers
+
+        for tier in self.tiers[1:]:
+            if tier.resolution is None:
+                raise ValueError("Only the first tier can hold raw readings")
+
+            # aggregates of each sealed raw partition must be complete
+            if self.partition % tier.resolution:
+                raise ValueError("Tier resolution must divide the partition "
+                                 "time")
+
+        # channels, in order; set by the first added reading
+        self.channels = None
+
+        # segments of each tier, in chronological order
+        self._segments = {tier.name: [] for tier in self.tiers}
+
+        # readings of the current partition of each tier: partition start
+        # time, and lists of reading times and sample values
+        self._pending = {tier.name: None for tier in self.tiers}
+
+        self._lock = threading.RLock()
+
+        self._open_segments()
+
+    def _open_segments(self):
+        """Reads the headers of existing segment files"""
+
+        for tier in self.tiers:
+            directory = os.path.join(self.path, tier.name)
+
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            names = sorted([name for name in os.listdir(directory)
+                            if name.endswith(ArchiveSegment.EXTENSION)])
+
+            segments = self._segments[tier.name]
+
+            for name in names:
+                segment = ArchiveSegment.open(os.path.join(directory, name))
+                self._check_channels(segment.channels)
+                segments.append(segment)
+
+            segments.sort(key=lambda segment: segment.start)
+
+            if segments:
+                logger.info("Opened %i %s segments", len(segments), tier.name)
+
+    def _check_channels(self, channels):
+        if self.channels is None:
+            self.channels = list(channels)
+        elif list(channels) != self.channels:
+            raise ValueError("Channels do not match the archived channels")
+
+    def _get_tier_partition(self, tier):
+        return tier.partition or self.partition
+
+    def segments(self, tier=None):
+        """Gets the sealed segments of a tier
+
+        :param tier: tier, or None for raw readings
+        :type tier: :class:`RetentionTier`
+        :return: segments, in chronological order
+        :rtype: List[:class:`ArchiveSegment`]
+        """
+
+        if tier is None:
+            tier = self.tiers[0]
+
+        with self._lock:
+            return list(self._segments[tier.name])
+
+    @property
+    def last_time(self):
+        """Time of the latest added reading, or None if there are none"""
+
+        with self._lock:
+            return self._get_last_time(self.tiers[0])
+
+    def _get_last_time(self, tier):
+        pending = self._pending[tier.name]
+
+        if pending is not None:
+            return int(pending[1][-1][-1])
+
+        segments = self._segments[tier.name]
+
+        if segments:
+            return segments[-1].max_time
+
+        return None
+
+    def attach(self, datastore):
+        """Archives readings from the specified datastore as they are inserted
+
+        Stored readings later than the latest archived reading are archived
+        first.
+
+        :param datastore: datastore
+        :type datastore: :class:`~datalog.data.DataStore`
+        :return: subscription, to pass to \
+        :meth:`~datalog.data.DataStore.unsubscribe` to stop archiving
+        :rtype: :class:`~datalog.subscription.CallbackSubscription`
+        """
+
+        last_time = self.last_time
+
+        if last_time is None:
+            last_time = -1
+
+        return datastore.subscribe_callback(self.add, since=last_time)
+
+    def add(self, readings):
+        """Adds the specified readings, sealing any partitions they complete
+
+        Readings no later than the latest added reading are ignored.
+
+        :param readings: list of readings, or block of readings, to add
+        :type readings: List[:class:`~datalog.data.Reading`] or \
+        :class:`~datalog.data.ReadingBlock`
+        :raises ValueError: if the readings' channels differ from the \
+        archived channels
+        """
+
+        if not isinstance(readings, ReadingBlock):
+            readings = ReadingBlock.instance_from_readings(readings)
+
+        if not len(readings):
+            return
+
+        with self._lock:
+            self._check_channels(readings.channels)
+
+            times = readings.reading_times
+            values = readings.values
+
+            last_time = self._get_last_time(self.tiers[0])
+
+            if last_time is not None:
+                # skip readings already archived
+                later = numpy.searchsorted(times, last_time, side="right")
+                times = times[later:]
+                values = values[later:]
+
+            self._add_to_tier(self.tiers[0], times, values)
+
+    def _add_to_tier(self, tier, times, values):
+        """Adds readings to a tier, sealing its pending partition if the \
+        readings are from a later partition"""
+
+        partition = self._get_tier_partition(tier)
+
+        # split the readings by partition
+        starts = times // partition * partition
+        boundaries = numpy.flatnonzero(numpy.diff(starts)) + 1
+
+        for part in numpy.split(numpy.arange(len(times)), boundaries):
+            if not len(part):
+                continue
+
+            start = int(starts[part[0]])
+            pending = self._pending[tier.name]
+
+            if pending is not None and pending[0] != start:
+                self._seal(tier)
+                pending = None
+
+            if pending is None:
+                pending = self._pending[tier.name] = (start, [], [])
+            elif pending[1][-1][-1] >= times[part[0]]:
+                # aggregates of resealed raw readings replace earlier ones
+                pending_times = numpy.concatenate(pending[1])
+                keep = numpy.searchsorted(pending_times, times[part[0]])
+
+                pending = self._pending[tier.name] = (
+                    start, [pending_times[:keep]],
+                    [numpy.concatenate(pending[2])[:keep]])
+
+            pending[1].append(times[part])
+            pending[2].append(values[part])
+
+    def seal(self):
+        """Seals the current partition of each tier, writing its readings \
+        to a segment file
+
+        Readings later added to a sealed partition are merged into its segment
+        file when the partition is sealed again.
+        """
+
+        with self._lock:
+            for tier in self.tiers:
+                if self._pending[tier.name] is not None:
+                    self._seal(tier)
+
+    def _seal(self, tier):
+        start, times, values = self._pending[tier.name]
+        self._pending[tier.name] = None
+
+        block = ReadingBlock(numpy.concatenate(times), self.channels,
+                             numpy.concatenate(values))
+
+        segments = self._segments[tier.name]
+
+        # merge into an existing segment for this partition, replacing any of
+        # its readings from the same times
+        if segments and segments[-1].start == start:
+            old = segments.pop().load()
+            keep = numpy.searchsorted(old.reading_times,
+                                      block.reading_times[0])
+
+            block = ReadingBlock(
+                numpy.concatenate([old.reading_times[:keep],
+                                   block.reading_times]),
+                self.channels, numpy.concatenate([old.values[:keep],
+                                                  block.values]))
+
+        path = os.path.join(self.path, tier.name, "{0:015d}{1}".format(
+            start, ArchiveSegment.EXTENSION))
+
+        segments.append(ArchiveSegment.write(path, start, block))
+
+        logger.debug("Sealed %s partition %i with %i readings", tier.name,
+                     start, len(block))
+
+        if tier is self.tiers[0]:
+            # add aggregates of the sealed readings to the other tiers
+            for aggregate_tier in self.tiers[1:]:
+                self._add_to_tier(aggregate_tier, *self._aggregate(
+                    block, aggregate_tier.resolution))
+
+        self.apply_retention(block.reading_times[-1])
+
+    @staticmethod
+    def _aggregate(block, resolution):
+        """Averages readings over intervals of the specified resolution
+
+        NaN values are ignored. Each average is given the start time of its
+        interval.
+
+        :return: interval start times and mean sample values
+        :rtype: Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+        """
+
+        buckets = block.reading_times // resolution * resolution
+        firsts = numpy.concatenate([[0],
+                                    numpy.flatnonzero(numpy.diff(buckets)) + 1])
+
+        valid = ~numpy.isnan(block.values)
+
+        sums = numpy.add.reduceat(numpy.where(valid, block.values, 0), firsts,
+                                  axis=0)
+        counts = numpy.add.reduceat(valid, firsts, axis=0)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+
+        return buckets[firsts], means
+
+    def apply_retention(self, now):
+        """Deletes segments older than their tier's retention time
+
+        :param now: time to measure retention from, usually the latest \
+        reading time
+        :type now: int
+        """
+
+        with self._lock:
+            for tier in self.tiers:
+                if tier.retention is None:
+                    continue
+
+                partition = self._get_tier_partition(tier)
+                segments = self._segments[tier.name]
+
+                # delete segments whose whole partition has expired
+                while segments and segments[0].start + partition \
+                                   <= now - tier.retention:
+                    segment = segments.pop(0)
+                    os.remove(segment.path)
+
+                    logger.info("Deleted expired segment %s", segment.path)
+
+    def get_reading_block(self, start=None, end=None, resolution=None):
+        """Gets readings with times in the half-open range [start, end)
+
+        Readings are taken from the sealed segments overlapping the range and
+        from the current partition in memory.
+
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :param resolution: coarsest acceptable resolution in ms; readings are \
+        taken from the coarsest tier with at most this resolution, or the raw \
+        tier if None
+        :type resolution: int
+        :return: readings, in chronological order
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        tier = self.get_tier(resolution)
+
+        with self._lock:
+            segments = self._segments[tier.name]
+            partition = self._get_tier_partition(tier)
+
+            # first segment whose partition could hold the start time
+            if start is None:
+                first = 0
+            else:
+                first = bisect.bisect_right([segment.start
+                                             for segment in segments],
+                                            start - partition)
+
+            times = []
+            values = []
+
+            for segment in segments[first:]:
+                if end is not None and segment.start >= end:
+                    break
+
+                if not segment.overlaps(start, end):
+                    continue
+
+                block = segment.load()
+                times.append(block.reading_times)
+                values.append(block.values)
+
+            pending = self._pending[tier.name]
+
+            if pending is not None:
+                times.extend(pending[1])
+                values.extend(pending[2])
+
+            channels = self.channels or []
+
+        if not times:
+            return ReadingBlock([], channels, numpy.empty((0, len(channels))))
+
+        times = numpy.concatenate(times)
+        values = numpy.concatenate(values)
+
+        # limit to the range
+        first = 0 if start is None else numpy.searchsorted(times, start)
+        last = len(times) if end is None else numpy.searchsorted(times, end)
+
+        return ReadingBlock(times[first:last], channels, values[first:last])
+
+    def get_tier(self, resolution=None):
+        """Gets the coarsest tier with at most the specified resolution
+
+        :param resolution: resolution in ms, or None for the raw tier
+        :type resolution: int
+        :rtype: :class:`RetentionTier`
+        """
+
+        if resolution is None:
+            return self.tiers[0]
+
+        resolution = parse_duration(resolution)
+
+        return max([tier for tier in self.tiers
+                    if (tier.resolution or 0) <= resolution],
+                   key=lambda tier: tier.resolution or 0)
@@ -0,0 +1,344 @@
+"""Compressed encoding of reading blocks
+
+Reading times usually advance by a constant sample time, so the differences
+between consecutive time differences (delta-of-delta) are mostly zero. Sample
+values usually change slowly, so they are encoded per channel, as either:
+
+* the differences between consecutive values, for channels holding only
+  integers such as raw ADC counts, or
+* the XOR of the bits of consecutive values, which shares the sign, exponent
+  and leading mantissa bits of similar values, for other channels.
+
+Signed integers are zig-zag encoded, so that small magnitudes map to small
+unsigned integers. The results are then written as variable-length integers
+(varints), seven bits per byte, with the high bit of each byte set on all but
+the last byte of an integer. All steps are vectorised with numpy.
+
+XOR encoding alone compresses non-integer values only slightly, e.g. by 1.4
+times for slowly changing voltages, as their low mantissa bits still differ.
+It leaves the differing bits aligned, so it is meant to be followed by a
+general purpose compressor such as :mod:`zlib`, which then compresses such
+values about 5 times.
+
+The encoded form is a header containing an identifier and the numbers of
+readings and channels, followed by the channels as little-endian int32 and the
+encoding of each channel as uint8, then the encoded times and each channel's
+encoded values, each preceded by its length as little-endian uint32.
+"""
+
+import struct
+
+import numpy
+
+from datalog.data import ReadingBlock
+
+# header: identifier, number of readings, number of channels
+HEADER = struct.Struct("<4sII")
+ID = b"DLC1"
+
+# length of each encoded section
+SECTION_LENGTH = struct.Struct("<I")
+
+# channel encodings
+ENCODING_INTEGER = 0
+ENCODING_XOR = 1
+
+# maximum number of bytes in a varint for a 64-bit integer
+MAX_VARINT_LEN = 10
+
+# largest integer a float64 holds exactly
+MAX_EXACT_INTEGER = 2 ** 53
+
+
+def zigzag_encode(values):
+    """Maps signed integers onto unsigned integers, small magnitudes first
+
+    :param values: signed integers
+    :type values: :class:`numpy.ndarray`
+    :rtype: :class:`numpy.ndarray` of uint64
+    """
+
+    values = numpy.asarray(values, dtype=numpy.int64)
+
+    return ((values << 1) ^ (values >> 63)).view(numpy.uint64)
+
+
+def zigzag_decode(values):
+    """Inverse of :func:`zigzag_encode`
+
+    :param values: unsigned integers
+    :type values: :class:`numpy.ndarray`
+    :rtype: :class:`numpy.ndarray` of int64
+    """
+
+    values = numpy.asarray(values, dtype=numpy.uint64)
+
+    return ((values >> numpy.uint64(1)).view(numpy.int64)
+            ^ -(values & numpy.uint64(1)).view(numpy.int64))
+
+
+def varint_encode(values):
+    """Encodes unsigned integers as varints
+
+    :param values: unsigned integers
+    :type values: :class:`numpy.ndarray`
+    :rtype: bytes
+    """
+
+    values = numpy.asarray(values, dtype=numpy.uint64)
+
+    # number of bytes for each value
+    lengths = numpy.ones(len(values), dtype=numpy.int64)
+
+    for n_bytes in range(1, MAX_VARINT_LEN):
+        lengths += values >= numpy.uint64(1) << numpy.uint64(7 * n_bytes)
+
+    # position of the first byte of each value
+    offsets = numpy.cumsum(lengths) - lengths
+
+    output = numpy.empty(int(lengths.sum()), dtype=numpy.uint8)
+
+    for index in range(MAX_VARINT_LEN):
+        selected = lengths > index
+
+        if not selected.any():
+            break
+
+        byte = (values[selected] >> numpy.uint64(7 * index)) \
+               & numpy.uint64(0x7f)
+
+        # set the continuation bit on all but the last byte
+        byte |= numpy.where(lengths[selected] > index + 1, numpy.uint64(0x80),
+                            numpy.uint64(0))
+
+        output[offsets[selected] + index] = byte
+
+    return output.tobytes()
+
+
+def varint_decode(data, count):
+    """Decodes varints
+
+    :param data: encoded varints
+    :type data: bytes
+    :param count: number of varints
+    :type count: int
+    :rtype: :class:`numpy.ndarray` of uint64
+    :raises ValueError: if the data does not hold the specified number of \
+    varints
+    """
+
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+
+    # last byte of each value
+    ends = numpy.flatnonzero(data < 0x80)
+
+    if len(ends) != count or (count and ends[-1] != len(data) - 1):
+        raise ValueError("Encoded data does not hold {0} values".format(count))
+
+    if not count:
+        return numpy.empty(0, dtype=numpy.uint64)
+
+    starts = numpy.concatenate([[0], ends[:-1] + 1])
+
+    if numpy.any(ends - starts >= MAX_VARINT_LEN):
+        raise ValueError("Encoded value is too long")
+
+    # position of each byte within its value
+    positions = numpy.arange(len(data)) - numpy.repeat(starts,
+                                                       ends - starts + 1)
+
+    parts = (data & 0x7f).astype(numpy.uint64) \
+            << (7 * positions).astype(numpy.uint64)
+
+    return numpy.bitwise_or.reduceat(parts, starts)
+
+
+def encode_times(times):
+    """Encodes reading times as delta-of-delta zig-zag varints
+
+    :param times: reading times
+    :type times: :class:`numpy.ndarray`
+    :rtype: bytes
+    """
+
+    times = numpy.asarray(times, dtype=numpy.int64)
+
+    deltas = numpy.diff(times, prepend=0)
+
+    return varint_encode(zigzag_encode(numpy.diff(deltas, prepend=0)))
+
+
+def decode_times(data, count):
+    """Inverse of :func:`encode_times`
+
+    :rtype: :class:`numpy.ndarray` of int64
+    """
+
+    return numpy.cumsum(numpy.cumsum(zigzag_decode(varint_decode(data,
+                                                                 count))))
+
+
+def get_encoding(values):
+    """Chooses the encoding for a channel's sample values
+
+    :param values: sample values
+    :type values: :class:`numpy.ndarray`
+    :return: :data:`ENCODING_INTEGER` if the values are all integers that \
+    float64 holds exactly, other than negative zero, otherwise \
+    :data:`ENCODING_XOR`
+    :rtype: int
+    """
+
+    with numpy.errstate(invalid="ignore"):
+        if numpy.all(numpy.abs(values) < MAX_EXACT_INTEGER) \
+        and numpy.array_equal(values, numpy.round(values)) \
+        and not numpy.any(numpy.signbit(values) & (values == 0)):
+            return ENCODING_INTEGER
+
+    return ENCODING_XOR
+
+
+def encode_values(values, encoding):
+    """Encodes a channel's sample values
+
+    XOR encoded values are best compressed further, e.g. with :mod:`zlib`.
+
+    :param values: sample values
+    :type values: :class:`numpy.ndarray`
+    :param encoding: encoding, from :func:`get_encoding`
+    :type encoding: int
+    :rtype: bytes
+    """
+
+    values = numpy.ascontiguousarray(values, dtype=numpy.float64)
+
+    if encoding == ENCODING_INTEGER:
+        return varint_encode(zigzag_encode(numpy.diff(
+            values.astype(numpy.int64), prepend=0)))
+
+    bits = values.view(numpy.uint64)
+
+    return varint_encode(bits ^ numpy.concatenate([[numpy.uint64(0)],
+                                                   bits[:-1]]))
+
+
+def decode_values(data, count, encoding):
+    """Inverse of :func:`encode_values`
+
+    :rtype: :class:`numpy.ndarray` of float64
+    :raises ValueError: if the encoding is not recognised
+    """
+
+    encoded = varint_decode(data, count)
+
+    if encoding == ENCODING_INTEGER:
+        return numpy.cumsum(zigzag_decode(encoded)).astype(numpy.float64)
+    elif encoding == ENCODING_XOR:
+        return numpy.bitwise_xor.accumulate(encoded).view(numpy.float64)
+
+    raise ValueError("Unrecognised channel encoding {0}".format(encoding))
+
+
+def encode_block(block):
+    """Encodes a block of readings
+
+    :param block: readings
+    :type block: :class:`~datalog.data.ReadingBlock`
+    :rtype: bytes
+    """
+
+    n_channels = len(block.channels)
+
+    encodings = [get_encoding(block.values[:, column])
+                 for column in range(n_channels)]
+
+    sections = [encode_times(block.reading_times)]
+    sections.extend([encode_values(block.values[:, column], encoding)
+                     for column, encoding in enumerate(encodings)])
+
+    parts = [HEADER.pack(ID, len(block), n_channels),
+             numpy.array(block.channels, dtype="<i4").tobytes(),
+             numpy.array(encodings, dtype=numpy.uint8).tobytes()]
+
+    for section in sections:
+        parts.append(SECTION_LENGTH.pack(len(section)))
+        parts.append(section)
+
+    return b"".join(parts)
+
+
+def decode_block(data):
+    """Decodes a block of readings encoded with :func:`encode_block`
+
+    :param data: encoded readings
+    :type data: bytes
+    :rtype: :class:`~datalog.data.ReadingBlock`
+    :raises ValueError: if the data is not a valid encoding
+    """
+
+    data = memoryview(data)
+
+    if len(data) < HEADER.size:
+        raise ValueError("Encoded data is too short")
+
+    identifier, n_readings, n_channels = HEADER.unpack_from(data)
+
+    if identifier != ID:
+        raise ValueError("Unrecognised encoded data identifier")
+
+    offset = HEADER.size
+
+    channels = numpy.frombuffer(data, dtype="<i4", count=n_channels,
+                                offset=offset)
+    offset += 4 * n_channels
+
+    encodings = numpy.frombuffer(data, dtype=numpy.uint8, count=n_channels,
+                                 offset=offset)
+    offset += n_channels
+
+    sections = []
+
+    for _ in range(n_channels + 1):
+        if len(data) < offset + SECTION_LENGTH.size:
+            raise ValueError("Encoded data is too short")
+
+        length, = SECTION_LENGTH.unpack_from(data, offset)
+        offset += SECTION_LENGTH.size
+
+        sections.append(data[offset:offset + length])
+        offset += length
+
+    if offset != len(data):
+        raise ValueError("Encoded data length does not match its header")
+
+    times = decode_times(sections[0], n_readings)
+
+    values = numpy.empty((n_readings, n_channels), dtype=numpy.float64)
+
+    for column, (section, encoding) in enumerate(zip(sections[1:],
+                                                     encodings)):
+        values[:, column] = decode_values(section, n_readings, encoding)
+
+    return ReadingBlock(times, channels.tolist(), values)
+
+
+def dump(block, fileobj):
+    """Writes an encoded block of readings to a file
+
+    :param block: readings
+    :type block: :class:`~datalog.data.ReadingBlock`
+    :param fileobj: binary file object
+    """
+
+    fileobj.write(encode_block(block))
+
+
+def load(fileobj):
+    """Reads an encoded block of readings from a file
+
+    :param fileobj: binary file object
+    :rtype: :class:`~datalog.data.ReadingBlock`
+    """
+
+    return decode_block(fileobj.read())
@@ -1,7 +1,14 @@
 """Data representation classes."""
 
 import json
+import struct
 import datetime
+import threading
+
+import numpy
+
+from .subscription import Subscription, CallbackSubscription
+from .pyramid import Pyramid, AggregateBlock, get_intervals
 
 # maximum requested readings
 MAX_AMOUNT = 1000
@@ -179,8 +186,219 @@ class Sample(object):
 
         return {'channel': self.channel, 'value': self.value}
 
+class ReadingBlock(object):
+    """Class to represent a block of readings for the same channels.
+
+    Reading times and sample values are held in arrays, so a block can be
+    passed from a device to a :class:`DataStore` without creating a
+    :class:`Reading` for each time.
+    """
+
+    def __init__(self, reading_times, channels, values):
+        """Initialises a reading block
+
+        :param reading_times: the timestamps of the readings, in milliseconds
+        :param channels: enabled channels, in order
+        :param values: (time, channel) sample values
+        :raises ValueError: if the shape of the values does not match the \
+        number of reading times and channels
+        """
+
+        self.reading_times = numpy.asarray(reading_times, dtype=numpy.int64)
+        self.channels = list(channels)
+        self.values = numpy.asarray(values, dtype=numpy.float64)
+
+        if self.values.shape != (len(self.reading_times), len(self.channels)):
+            raise ValueError("Specified values do not match the specified "
+                             "reading times and channels")
+
+    # binary representation header: identifier, number of readings, number of
+    # channels
+    BINARY_HEADER = struct.Struct("<4sII")
+    BINARY_ID = b"DLB1"
+
+    def __len__(self):
+        """Number of readings in this block"""
+        return len(self.reading_times)
+
+    def __repr__(self):
+        """String representation of this block"""
+        return self.csv_repr()
+
+    def csv_repr(self):
+        """CSV representation of this block"""
+        return "\n".join(self.csv_rows())
+
+    def json_repr(self):
+        """JSON representation of this block
+
+        This is a list of reading dicts, the same as
+        :meth:`DataStore.json_repr`.
+        """
+
+        return "[" + ", ".join(self.json_rows()) + "]"
+
+    def csv_rows(self):
+        """CSV representation of each reading in this block
+
+        Rows are formatted directly from the arrays with a template, giving the
+        same output as :meth:`Reading.csv_repr`.
+
+        :rtype: List[str]
+        """
+
+        template = "%d" + ",%r" * len(self.channels)
+
+        return [template % row for row in self._rows()]
+
+    def json_rows(self):
+        """JSON representation of each reading in this block
+
+        Rows are formatted directly from the arrays with a template, giving the
+        same output as :meth:`Reading.json_repr`.
+
+        :rtype: List[str]
+        """
+
+        samples = ", ".join(['{"channel": ' + json.dumps(channel)
+                             + ', "value": %s}' for channel in self.channels])
+        template = '{"reading_time": %d, "channels": ' \
+                   + json.dumps(self.channels).replace("%", "%%") \
+                   + ', "samples": [' + samples + ']}'
+
+        rows = self._rows()
+
+        if not numpy.isfinite(self.values).all():
+            # format non-finite values as the json module does
+            rows = [tuple([row[0]] + [self._json_float(value)
+                                      for value in row[1:]])
+                    for row in rows]
+
+        return [template % row for row in rows]
+
+    @staticmethod
+    def _json_float(value):
+        if value != value:
+            return "NaN"
+        elif value == float("inf"):
+            return "Infinity"
+        elif value == -float("inf"):
+            return "-Infinity"
+
+        return repr(value)
+
+    def _rows(self):
+        """Each reading's time and sample values, as a tuple"""
+        return zip(self.reading_times.tolist(), *self.values.T.tolist())
+
+    def binary_repr(self):
+        """Binary representation of this block
+
+        This is a header containing an identifier and the numbers of readings
+        and channels, followed by the channels as little-endian int32, the
+        reading times as little-endian int64 and the sample values, in reading
+        order, as little-endian float64.
+
+        :rtype: bytes
+        """
+
+        return b"".join([
+            self.BINARY_HEADER.pack(self.BINARY_ID, len(self),
+                                    len(self.channels)),
+            numpy.array(self.channels, dtype="<i4").tobytes(),
+            self.reading_times.astype("<i8").tobytes(),
+            self.values.astype("<f8").tobytes()
+        ])
+
+    @classmethod
+    def instance_from_binary(cls, data):
+        """Returns a new instance of the reading block using the specified \
+        binary representation
+
+        :param data: binary representation, from :meth:`binary_repr`
+        :type data: bytes
+        :raises ValueError: if the data is not a valid binary representation
+        """
+
+        header_size = cls.BINARY_HEADER.size
+
+        if len(data) < header_size:
+            raise ValueError("Binary data is too short")
+
+        identifier, n_readings, n_channels = \
+            cls.BINARY_HEADER.unpack_from(data)
+
+        if identifier != cls.BINARY_ID:
+            raise ValueError("Unrecognised binary data identifier")
+
+        if len(data) != header_size + 4 * n_channels + 8 * n_readings \
+                        * (1 + n_channels):
+            raise ValueError("Binary data length does not match its header")
+
+        channels = numpy.frombuffer(data, dtype="<i4", count=n_channels,
+                                    offset=header_size)
+        times = numpy.frombuffer(data, dtype="<i8", count=n_readings,
+                                 offset=header_size + 4 * n_channels)
+        values = numpy.frombuffer(data, dtype="<f8",
+                                  count=n_readings * n_channels,
+                                  offset=header_size + 4 * n_channels
+                                  + 8 * n_readings)
+
+        return cls(times, channels.tolist(),
+                   values.reshape(n_readings, n_channels))
+
+    def to_readings(self):
+        """Creates reading objects for this block
+
+        :return: readings
+        :rtype: List[:class:`~datalog.data.Reading`]
+        """
+
+        return [Reading(reading_time, self.channels, samples)
+                for reading_time, samples in zip(self.reading_times.tolist(),
+                                                 self.values.tolist())]
+
+    @classmethod
+    def instance_from_readings(cls, readings):
+        """Returns a new instance of the reading block using the specified \
+        readings
+
+        :param readings: readings with the same channels
+        :type readings: List[:class:`~datalog.data.Reading`]
+        :raises ValueError: if the readings do not all have the same channels
+        """
+
+        readings = list(readings)
+
+        if readings:
+            channels = readings[0].channels
+        else:
+            channels = []
+
+        if any([reading.channels != channels for reading in readings]):
+            raise ValueError("Readings do not all have the same channels")
+
+        return cls([reading.reading_time for reading in readings], channels,
+                   numpy.array([[sample.value for sample in reading.samples]
+                                for reading in readings],
+                               dtype=numpy.float64).reshape(len(readings),
+                                                            len(channels)))
+
 class DataStore(object):
-    """Class to store and retrieve ADC readings."""
+    """Class to store and retrieve ADC readings.
+
+    Readings are held in columnar form: reading times in a preallocated int64
+    array and sample values in a preallocated 2-D float64 array indexed by
+    (time, channel). :class:`Reading` objects are only created when readings
+    are requested.
+
+    The arrays form a fixed-capacity circular buffer: once ``max_size``
+    readings are stored, new readings overwrite the oldest in place.
+
+    If aggregate resolutions are specified, each insert also updates a
+    :class:`~datalog.pyramid.Pyramid` of aggregates at those resolutions, used
+    by :meth:`get_downsampled`.
+    """
 
     # default datastore size
     DEFAULT_SIZE = 1000
@@ -188,12 +406,31 @@ class DataStore(object):
     # default number of readings to return
     DEFAULT_AMOUNT = 1000
 
-    def __init__(self, max_size=None, conversion_callbacks=None):
+    # suggested aggregate resolutions, in ms
+    DEFAULT_RESOLUTIONS = [10000, 60000, 600000, 3600000]
+
+    # minimum number of aggregates to keep at each resolution
+    PYRAMID_SIZE = 10000
+
+    # default number of readings per chunk when iterating
+    DEFAULT_CHUNK_SIZE = 10000
+
+    # default width of groups of readings, in ms
+    DEFAULT_BUCKET_WIDTH = 24 * 60 * 60 * 1000
+
+    def __init__(self, max_size=None, conversion_callbacks=None,
+                 block_conversion_callbacks=None, resolutions=None):
         """Initialises the datastore
 
         :param max_size: the maximum number of readings to hold in the datastore
         :param conversion_callbacks: list of methods to call on each reading's \
         data
+        :param block_conversion_callbacks: list of methods to call on the \
+        (time, channel) array of sample values from each insert; each must \
+        return an array of the same shape
+        :param resolutions: aggregate resolutions in ms, e.g. \
+        :attr:`DEFAULT_RESOLUTIONS`, or None to keep no aggregates
+        :type resolutions: List[int]
         """
 
         if max_size is None:
@@ -202,11 +439,39 @@ class DataStore(object):
         if conversion_callbacks is None:
             conversion_callbacks = []
 
+        if block_conversion_callbacks is None:
+            block_conversion_callbacks = []
+
+        if resolutions is None:
+            resolutions = []
+
         self.max_size = int(max_size)
         self.conversion_callbacks = list(conversion_callbacks)
+        self.block_conversion_callbacks = list(block_conversion_callbacks)
+
+        # channels, in order; set by the first inserted reading
+        self.channels = None
+
+        # reading times, in ms
+        self._times = numpy.zeros(self.max_size, dtype=numpy.int64)
+
+        # sample values, allocated once the number of channels is known
+        self._values = None
+
+        # storage index of the oldest reading
+        self._head = 0
+
+        # number of stored readings
+        self._count = 0
+
+        # lock for access from retriever and reader threads
+        self._lock = threading.RLock()
 
-        # initialise readings as a queue
-        self.readings = []
+        # subscriptions to new readings
+        self._subscriptions = []
+
+        # aggregates of inserted readings
+        self._pyramid = Pyramid(resolutions, self.PYRAMID_SIZE)
 
     @classmethod
     def instance_from_json(cls, json_str, *args, **kwargs):
@@ -249,15 +514,141 @@ class DataStore(object):
 
     def csv_repr(self, **options):
         """CSV representation of this datastore"""
-        return "\n".join([reading.csv_repr() for reading in self.get_readings(**options)])
+        return self.get_reading_block(**options).csv_repr()
 
     def list_repr(self, **options):
         """List representation of this datastore"""
-        return [reading.csv_repr() for reading in self.get_readings(**options)]
+        return self.get_reading_block(**options).csv_rows()
 
     def json_repr(self, **options):
         """JSON representation of this datastore"""
-        return json.dumps([reading.dict_repr() for reading in self.get_readings(**options)])
+        return self.get_reading_block(**options).json_repr()
+
+    def iter_blocks(self, start=None, end=None, chunk_size=None):
+        """Iterates over the readings with times in the half-open range \
+        [start, end) in blocks
+
+        Each block is copied from storage while the datastore is locked, and
+        the next block starts after the latest reading of the previous block,
+        so readings inserted during iteration are handled consistently.
+
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :param chunk_size: maximum number of readings per block
+        :type chunk_size: int
+        :return: readings, in chronological order
+        :rtype: Generator[:class:`~datalog.data.ReadingBlock`]
+        """
+
+        if chunk_size is None:
+            chunk_size = self.DEFAULT_CHUNK_SIZE
+
+        chunk_size = int(chunk_size)
+
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1")
+
+        while True:
+            with self._lock:
+                first, last = self._range_indices(start, end)
+                last = min(last, first + chunk_size)
+
+                if last <= first:
+                    return
+
+                times, values = self._get_block(first, last)
+                block = ReadingBlock(numpy.array(times), self.channels,
+                                     numpy.array(values))
+
+            yield block
+
+            start = int(block.reading_times[-1]) + 1
+
+    def iter_csv(self, start=None, end=None, chunk_size=None):
+        """Iterates over chunks of the CSV representation of the readings \
+        with times in the half-open range [start, end)
+
+        The chunks joined together are the same as :meth:`csv_repr`, but only
+        one chunk is held in memory at a time.
+
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :param chunk_size: maximum number of readings per chunk
+        :type chunk_size: int
+        :rtype: Generator[str]
+        """
+
+        separator = ""
+
+        for block in self.iter_blocks(start, end, chunk_size):
+            yield separator + "\n".join(block.csv_rows())
+            separator = "\n"
+
+    def iter_json(self, start=None, end=None, chunk_size=None):
+        """Iterates over chunks of the JSON representation of the readings \
+        with times in the half-open range [start, end)
+
+        The chunks joined together are the same as :meth:`json_repr`, but
+        only one chunk is held in memory at a time.
+
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :param chunk_size: maximum number of readings per chunk
+        :type chunk_size: int
+        :rtype: Generator[str]
+        """
+
+        separator = "["
+
+        for block in self.iter_blocks(start, end, chunk_size):
+            yield separator + ", ".join(block.json_rows())
+            separator = ", "
+
+        if separator == "[":
+            # no readings
+            yield "[]"
+        else:
+            yield "]"
+
+    def write_csv(self, fileobj, start=None, end=None, chunk_size=None):
+        """Writes the CSV representation of the readings with times in the \
+        half-open range [start, end) to a file in chunks
+
+        :param fileobj: text file object, e.g. an open file or \
+        :meth:`socket.socket.makefile`
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :param chunk_size: maximum number of readings per chunk
+        :type chunk_size: int
+        """
+
+        for chunk in self.iter_csv(start, end, chunk_size):
+            fileobj.write(chunk)
+
+    def write_json(self, fileobj, start=None, end=None, chunk_size=None):
+        """Writes the JSON representation of the readings with times in the \
+        half-open range [start, end) to a file in chunks
+
+        :param fileobj: text file object, e.g. an open file or \
+        :meth:`socket.socket.makefile`
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :param chunk_size: maximum number of readings per chunk
+        :type chunk_size: int
+        """
+
+        for chunk in self.iter_json(start, end, chunk_size):
+            fileobj.write(chunk)
 
     def get_readings(self, amount=None, desc=False, pivot_time=None,
                       pivot_after=True):
@@ -273,6 +664,53 @@ class DataStore(object):
         :type pivot_after: boolean
         """
 
+        with self._lock:
+            return self._build_readings(*self._query_indices(amount, desc,
+                                                             pivot_time,
+                                                             pivot_after))
+
+    def get_reading_block(self, amount=None, desc=False, pivot_time=None,
+                          pivot_after=True, start=None, end=None):
+        """Get readings from datastore given certain filters, as a block
+
+        This supports the filters of :meth:`get_readings`, and additionally
+        limits the readings to the half-open time range [start, end). The block
+        holds copies of the stored data, so it is unaffected by later inserts.
+
+        :param amount: maximum number of readings to return
+        :type amount: int
+        :param desc: descending order (false for ascending)
+        :type desc: boolean
+        :param pivot_time: time to return data from before or after
+        :type pivot_time: int
+        :param pivot_after: return times after pivot (false for before)
+        :type pivot_after: boolean
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :return: readings, in chronological order
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        with self._lock:
+            times, values = self._get_block(*self._query_indices(
+                amount, desc, pivot_time, pivot_after, start, end))
+
+            return ReadingBlock(numpy.array(times), self.channels or [],
+                                numpy.array(values))
+
+    def _query_indices(self, amount, desc, pivot_time, pivot_after, start=None,
+                       end=None):
+        """Finds the indices of the stored readings matching the specified \
+        filters
+
+        See :meth:`get_reading_block` for the filters.
+
+        :return: index of the first reading and index after the last reading
+        :rtype: Tuple[int, int]
+        """
+
         if amount is None:
             amount = self.DEFAULT_AMOUNT
 
@@ -293,49 +731,414 @@ class DataStore(object):
         if pivot_time < 0:
             pivot_time = 0
 
-        # create pivot function
+        first, last = self._range_indices(start, end)
+
+        # reading times are strictly increasing, so the pivot can be found by
+        # bisection
         if pivot_after:
-            fnc_pivot = lambda r: r.reading_time > pivot_time
+            first = max(first, self._search(pivot_time, side="right"))
         else:
-            fnc_pivot = lambda r: r.reading_time <= pivot_time
+            last = min(last, self._search(pivot_time, side="right"))
 
-        # get results from pivot
-        readings = [reading for reading in self.readings if fnc_pivot(reading)]
+        last = max(first, last)
 
         # get ordered result set
         if desc:
-            readings = readings[-amount:]
+            first = max(first, last - amount)
         else:
-            readings = readings[:amount]
+            last = min(last, first + amount)
 
-        return readings
+        return first, last
 
-    def get_datetime_grouped_readings(self, *args, **kwargs):
-        """Get readings grouped by date
+    def get_range(self, start=None, end=None):
+        """Get readings with times in the half-open range [start, end)
 
-        :param group_date_format: date format to use when grouping readings
-        :type group_date_format: str
+        :param start: earliest reading time to return, or None for no limit
+        :type start: int
+        :param end: time after the last reading to return, or None for no \
+        limit
+        :type end: int
+        :return: readings, in chronological order
+        :rtype: List[:class:`~datalog.data.Reading`]
         """
 
-        # reading list
-        readings = self.get_readings(*args, **kwargs)
+        with self._lock:
+            return self._build_readings(*self._range_indices(start, end))
+
+    def to_numpy(self, channels=None, start=None, end=None):
+        """Get reading times and sample values as arrays
+
+        Readings are selected from the half-open time range [start, end). Where
+        possible, the returned arrays are read-only views of the datastore's
+        storage rather than copies. Views are overwritten as new readings
+        replace old ones, so copy them if they are to be kept.
+
+        :param channels: channels to return values for, in order, or None for \
+        all channels
+        :type channels: List[int]
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :return: reading times and (time, channel) sample values
+        :rtype: Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+        :raises ValueError: if a specified channel is not stored
+        """
 
-        groups = {}
+        with self._lock:
+            times, values = self._get_block(*self._range_indices(start, end))
 
-        for reading in readings:
-            reading_date = reading.reading_date
+        if channels is not None:
+            values = values[:, self._channel_columns(channels)]
+
+        return self._read_only(times), self._read_only(values)
+
+    def get_channel(self, channel, start=None, end=None):
+        """Get the sample values of a single channel as an array
+
+        This is like :meth:`to_numpy` for a single channel, but returns only the
+        1-D array of sample values.
+
+        :param channel: channel to return values for
+        :type channel: int
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :return: sample values
+        :rtype: :class:`numpy.ndarray`
+        :raises ValueError: if the channel is not stored
+        """
+
+        _, values = self.to_numpy([channel], start, end)
+
+        return values[:, 0]
+
+    def get_downsampled(self, points, channels=None, start=None, end=None):
+        """Get aggregates of the readings in the half-open time range \
+        [start, end) at the coarsest resolution giving at least the specified \
+        number of points
+
+        Aggregates are kept for longer than readings, so they can cover times
+        for which readings are no longer stored. If no resolution is fine
+        enough, or the datastore keeps no aggregates, the stored readings are
+        returned as one aggregate each.
+
+        :param points: minimum number of points, e.g. the width of a plot
+        :type points: int
+        :param channels: channels to return aggregates for, in order, or None \
+        for all channels
+        :type channels: List[int]
+        :param start: earliest time, or None for the earliest aggregate
+        :type start: int
+        :param end: time after the last reading, or None for after the latest \
+        reading
+        :type end: int
+        :return: aggregates
+        :rtype: :class:`~datalog.pyramid.AggregateBlock`
+        :raises ValueError: if a specified channel is not stored
+        """
+
+        with self._lock:
+            if channels is None:
+                columns = None
+                channels = self.channels or []
+            else:
+                columns = self._channel_columns(channels)
+
+            self._pyramid.flush()
+
+            if start is None or end is None:
+                # limit to the times held by the aggregates and readings
+                first_times = [level.first_time()
+                               for level in self._pyramid.levels]
+
+                if self._count:
+                    first_times.append(int(self._get_block(0, 1)[0][0]))
+
+                first_times = [first_time for first_time in first_times
+                               if first_time is not None]
+                last_time = self._last_time()
+
+                if last_time is None or not first_times:
+                    start = end = 0
+                else:
+                    if start is None:
+                        start = min(first_times)
+
+                    if end is None:
+                        end = last_time + 1
 
-            if reading_date not in groups:
-                # create group
-                groups[reading_date] = []
+            level = self._pyramid.get_level(int(points), int(start), int(end))
 
-            groups[reading_date].append(reading)
+            if level is not None and level.count:
+                times, counts, mins, maxs, means = level.get(start, end,
+                                                             columns)
+
+                return AggregateBlock(times, channels, counts, mins, maxs,
+                                      means, level.resolution)
+
+            times, values = self._get_block(*self._range_indices(start, end))
+
+            if columns is not None:
+                values = values[:, columns]
+
+            return AggregateBlock.instance_from_values(times, channels, values)
+
+    def _channel_columns(self, channels):
+        """Gets the storage columns of the specified channels
+
+        The columns are returned as a slice where possible, so that indexing
+        with them gives a view rather than a copy.
+
+        :param channels: channels, in order
+        :type channels: List[int]
+        :return: column indices
+        :rtype: slice or List[int]
+        :raises ValueError: if a specified channel is not stored
+        """
+
+        stored_channels = self.channels or []
+        columns = []
+
+        for channel in channels:
+            try:
+                columns.append(stored_channels.index(int(channel)))
+            except ValueError:
+                raise ValueError("Channel {0} is not stored".format(channel))
+
+        if len(columns) == 1:
+            return slice(columns[0], columns[0] + 1)
+        elif len(columns) > 1:
+            step = columns[1] - columns[0]
+
+            # evenly spaced columns can be sliced
+            if step > 0 and columns == list(range(columns[0],
+                                                  columns[-1] + 1, step)):
+                return slice(columns[0], columns[-1] + 1, step)
+
+        return columns
+
+    @staticmethod
+    def _read_only(array):
+        """Returns a read-only view of the specified array
+
+        :param array: array
+        :type array: :class:`numpy.ndarray`
+        :return: read-only view
+        :rtype: :class:`numpy.ndarray`
+        """
+
+        view = array.view()
+        view.flags.writeable = False
+
+        return view
+
+    def _range_indices(self, start=None, end=None):
+        """Finds the indices of the stored readings with times in the \
+        half-open range [start, end)
+
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :return: index of the first reading and index after the last reading
+        :rtype: Tuple[int, int]
+        """
+
+        if start is None:
+            first = 0
+        else:
+            first = self._search(int(start))
+
+        if end is None:
+            last = self._count
+        else:
+            last = self._search(int(end))
+
+        return first, max(first, last)
+
+    def _search(self, reading_time, side="left"):
+        """Finds the index at which a reading with the specified time would be \
+        inserted to keep the stored reading times in order
+
+        :param reading_time: reading time to search for
+        :type reading_time: int
+        :param side: "left" to return the index of a reading with equal time, \
+        or "right" to return the index after it
+        :type side: str
+        :return: reading index
+        :rtype: int
+        """
+
+        index = 0
+
+        # each storage slice is sorted, and the slices are in order
+        for part in self._storage_slices(0, self._count):
+            times = self._times[part]
+            position = int(numpy.searchsorted(times, reading_time, side=side))
+
+            index += position
+
+            if position < len(times):
+                break
+
+        return index
+
+    def _build_readings(self, start, stop):
+        """Creates reading objects for the specified range of stored readings
+
+        :param start: index of the first reading
+        :type start: int
+        :param stop: index after the last reading
+        :type stop: int
+        :return: readings
+        :rtype: List[:class:`~datalog.data.Reading`]
+        """
+
+        times, values = self._get_block(start, stop)
+
+        return ReadingBlock(times, self.channels or [], values).to_readings()
+
+    def _storage_slices(self, start, stop):
+        """Maps a range of stored readings onto slices of the storage arrays
+
+        Readings are indexed in chronological order, from zero for the oldest
+        stored reading. A range spanning the end of the circular buffer maps
+        onto two slices.
+
+        :param start: index of the first reading
+        :type start: int
+        :param stop: index after the last reading
+        :type stop: int
+        :return: storage slices, in chronological order
+        :rtype: List[slice]
+        """
+
+        if stop <= start:
+            return []
+
+        # storage index of the first reading
+        first = (self._head + start) % self.max_size
+
+        # number of readings in range
+        length = stop - start
+
+        if first + length <= self.max_size:
+            return [slice(first, first + length)]
+
+        return [slice(first, self.max_size),
+                slice(0, first + length - self.max_size)]
+
+    def _get_block(self, start, stop):
+        """Gets the times and values of a range of stored readings
+
+        The returned arrays are views of the storage unless the range spans the
+        end of the circular buffer, in which case they are copies.
+
+        :param start: index of the first reading
+        :type start: int
+        :param stop: index after the last reading
+        :type stop: int
+        :return: reading times and (time, channel) sample values
+        :rtype: Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+        """
+
+        slices = self._storage_slices(start, stop)
+
+        if not slices:
+            return (numpy.empty(0, dtype=numpy.int64),
+                    numpy.empty((0, len(self.channels or [])),
+                                dtype=numpy.float64))
+        elif len(slices) == 1:
+            return self._times[slices[0]], self._values[slices[0]]
+
+        return (numpy.concatenate([self._times[part] for part in slices]),
+                numpy.concatenate([self._values[part] for part in slices]))
+
+    @property
+    def readings(self):
+        """All stored readings, in chronological order
+
+        :return: readings
+        :rtype: List[:class:`~datalog.data.Reading`]
+        """
+
+        with self._lock:
+            return self._build_readings(0, self._count)
+
+    def get_datetime_grouped_readings(self, *args, bucket_width=None,
+                                      **kwargs):
+        """Get readings grouped by time
+
+        Readings are grouped into buckets of the specified width, starting at
+        multiples of the width from the epoch. Buckets are computed
+        arithmetically from the reading times, so only one
+        :class:`~datetime.datetime` is created per bucket.
+
+        Other arguments are passed to :meth:`get_reading_block`, which takes
+        the same filters as :meth:`get_readings`.
+
+        :param bucket_width: bucket width in ms, or None for one day
+        :type bucket_width: int
+        :return: readings, by UTC bucket start time
+        :rtype: Dict[:class:`~datetime.datetime`, \
+        List[:class:`~datalog.data.Reading`]]
+        """
+
+        if bucket_width is None:
+            bucket_width = self.DEFAULT_BUCKET_WIDTH
+
+        block = self.get_reading_block(*args, **kwargs)
+
+        if not len(block):
+            return {}
+
+        intervals, firsts = get_intervals(block.reading_times,
+                                          int(bucket_width))
+        readings = block.to_readings()
+
+        groups = {}
+
+        for interval, first, last in zip(intervals.tolist(), firsts.tolist(),
+                                         firsts[1:].tolist() + [len(block)]):
+            bucket_date = datetime.datetime.utcfromtimestamp(interval / 1000)
+            groups[bucket_date] = readings[first:last]
 
         return groups
 
+    def get_bucketed(self, bucket_width, channels=None, start=None, end=None):
+        """Get the mean, minimum, maximum, standard deviation and count of \
+        each channel's values in buckets of the specified width
+
+        Buckets start at multiples of the width from the epoch. Buckets with
+        no readings are omitted. NaN values are ignored.
+
+        :param bucket_width: bucket width, in ms
+        :type bucket_width: int
+        :param channels: channels to return aggregates for, in order, or None \
+        for all channels
+        :type channels: List[int]
+        :param start: earliest reading time, or None for no limit
+        :type start: int
+        :param end: time after the last reading, or None for no limit
+        :type end: int
+        :return: aggregates
+        :rtype: :class:`~datalog.pyramid.AggregateBlock`
+        :raises ValueError: if a specified channel is not stored
+        """
+
+        times, values = self.to_numpy(channels, start, end)
+
+        if channels is None:
+            channels = self.channels or []
+
+        return AggregateBlock.instance_from_readings(times, channels, values,
+                                                     bucket_width)
+
     @property
     def num_readings(self):
-        return len(self.readings)
+        return self._count
 
     def sample_dict_gen(self):
         """Get dicts containing individual samples, across all channels
@@ -350,12 +1153,37 @@ class DataStore(object):
     def insert(self, readings):
         """Inserts the specified readings into the datastore
 
-        :param readings: list of readings to insert
+        :param readings: list of readings, or block of readings, to insert
+        :type readings: List[:class:`~datalog.data.Reading`] or \
+        :class:`~datalog.data.ReadingBlock`
+        :raises ValueError: if a reading time is earlier than an existing \
+        reading, or if a reading's channels differ from the stored channels
+        """
+
+        with self._lock:
+            if isinstance(readings, ReadingBlock):
+                self._insert_reading_block(readings)
+            else:
+                self._insert_readings(readings)
+
+    def _insert_readings(self, readings):
+        """Inserts the specified list of readings into the datastore
+
+        :param readings: readings to insert
         :type readings: List[:class:`~datalog.data.Reading`]
-        :raises ValueError: if a reading time is earlier than an existing reading
+        :raises ValueError: if a reading time is earlier than an existing \
+        reading, or if a reading's channels differ from the stored channels
         """
 
-        # add each reading, but check it is a later timestamp than the last
+        # time of the latest reading
+        last_time = self._last_time()
+
+        channels = self.channels
+
+        # readings to store
+        valid_readings = []
+
+        # check each reading is a later timestamp than the last
         for reading in readings:
             # check if reading is invalid: reading time is zero and samples are zero
             if reading.reading_time == 0 and not \
@@ -363,31 +1191,269 @@ class DataStore(object):
                 continue
 
             # check the reading time is latest
-            if self.readings:
-                if reading.reading_time <= self.readings[-1].reading_time:
-                    raise ValueError("A new reading time is earlier than or "
-                                     "equal to an existing reading time")
+            if last_time is not None and reading.reading_time <= last_time:
+                raise ValueError("A new reading time is earlier than or "
+                                 "equal to an existing reading time")
+
+            # check the channels match the stored channels
+            if channels is None:
+                channels = list(reading.channels)
+            elif reading.channels != channels:
+                raise ValueError("A new reading's channels do not match the "
+                                 "stored channels")
+
+            last_time = reading.reading_time
+            valid_readings.append(reading)
 
-            # everything's ok, so add it to the list
-            self._insert_reading(reading)
+        if not valid_readings:
+            return
 
-    def _insert_reading(self, reading):
-        """Inserts the specified reading, converting it if necessary
+        if self.channels is None:
+            self._set_channels(channels)
 
-        :param reading: reading to insert
-        :type reading: :class:`~datalog.data.Reading`
+        # call conversion functions
+        for reading in valid_readings:
+            for fcn in self.conversion_callbacks:
+                reading.apply_function(fcn)
+
+        times = numpy.array([reading.reading_time
+                             for reading in valid_readings], dtype=numpy.int64)
+        values = numpy.array([[sample.value for sample in reading.samples]
+                              for reading in valid_readings],
+                             dtype=numpy.float64)
+
+        # everything's ok, so add them to storage
+        self._store(times, values)
+
+    def _insert_reading_block(self, block):
+        """Inserts the specified block of readings into the datastore
+
+        :param block: readings to insert
+        :type block: :class:`~datalog.data.ReadingBlock`
+        :raises ValueError: if a reading time is earlier than an existing \
+        reading, or if the block's channels differ from the stored channels
         """
 
+        times = block.reading_times
+        values = block.values
+
+        # discard invalid readings: reading time is zero and samples are zero
+        valid = (times != 0) | values.any(axis=1)
+
+        if not valid.all():
+            times = times[valid]
+            values = values[valid]
+
+        if not len(times):
+            return
+
+        # time of the latest reading
+        last_time = self._last_time()
+
+        # check the reading times are latest and increasing
+        if (last_time is not None and times[0] <= last_time) \
+        or numpy.any(numpy.diff(times) <= 0):
+            raise ValueError("A new reading time is earlier than or "
+                             "equal to an existing reading time")
+
+        # check the channels match the stored channels
+        if self.channels is None:
+            self._set_channels(block.channels)
+        elif block.channels != self.channels:
+            raise ValueError("A new reading's channels do not match the "
+                             "stored channels")
+
         # call conversion functions
-        for fcn in self.conversion_callbacks:
-            reading.apply_function(fcn)
+        if self.conversion_callbacks:
+            values = values.copy()
+
+            for row in values:
+                for fcn in self.conversion_callbacks:
+                    row[:] = fcn(row.tolist())
+
+        # everything's ok, so add them to storage
+        self._store(times, values)
+
+    def _last_time(self):
+        """Gets the time of the latest stored reading
+
+        :return: reading time, or None if there are no stored readings
+        :rtype: int
+        """
+
+        if not self._count:
+            return None
+
+        return int(self._times[(self._head + self._count - 1) % self.max_size])
+
+    def _store(self, times, values):
+        """Converts and stores the specified validated readings
+
+        :param times: reading times, in chronological order
+        :type times: :class:`numpy.ndarray`
+        :param values: (time, channel) sample values
+        :type values: :class:`numpy.ndarray`
+        """
+
+        # call block conversion functions
+        values = self._convert_block(values)
+
+        self._insert_block(times, values)
+
+        self._pyramid.insert(times, values)
+
+        if self._subscriptions:
+            # one read-only block shared by all subscriptions
+            block = ReadingBlock(times.copy(), self.channels, values.copy())
+            block.reading_times.flags.writeable = False
+            block.values.flags.writeable = False
+
+            for subscription in self._subscriptions:
+                subscription.put(block)
+
+    def subscribe(self, queue_size=None, since=None):
+        """Subscribes to readings as they are inserted
+
+        The returned subscription can be iterated over, either normally or
+        with ``async for``, to get each inserted
+        :class:`~datalog.data.ReadingBlock` as soon as it is inserted.
+
+        :param queue_size: maximum number of blocks to queue
+        :type queue_size: int
+        :param since: if specified, stored readings later than this time are \
+        queued as the first block
+        :type since: int
+        :return: subscription
+        :rtype: :class:`~datalog.subscription.Subscription`
+        """
+
+        return self._add_subscription(Subscription(self, queue_size), since)
 
-        # add reading to storage
-        self.readings.append(reading)
+    def subscribe_callback(self, callback, queue_size=None, since=None):
+        """Subscribes a function to readings as they are inserted
 
-        # truncate oversized lists
-        while self.num_readings > self.max_size:
-            self.readings.pop(0)
+        The function is called with each inserted
+        :class:`~datalog.data.ReadingBlock` from a dedicated thread.
+
+        :param callback: function to call with each block
+        :param queue_size: maximum number of blocks to queue
+        :type queue_size: int
+        :param since: if specified, stored readings later than this time are \
+        passed as the first block
+        :type since: int
+        :return: subscription
+        :rtype: :class:`~datalog.subscription.CallbackSubscription`
+        """
+
+        return self._add_subscription(CallbackSubscription(self, callback,
+                                                           queue_size), since)
+
+    def _add_subscription(self, subscription, since):
+        with self._lock:
+            if since is not None:
+                times, values = self._get_block(
+                    *self._range_indices(int(since) + 1))
+
+                if len(times):
+                    subscription.put(ReadingBlock(numpy.array(times),
+                                                  self.channels,
+                                                  numpy.array(values)))
+
+            self._subscriptions.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Removes the specified subscription
+
+        :param subscription: subscription
+        :type subscription: :class:`~datalog.subscription.Subscription`
+        """
+
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def _convert_block(self, values):
+        """Applies the block conversion functions to the specified sample \
+        values
+
+        :param values: (time, channel) sample values
+        :type values: :class:`numpy.ndarray`
+        :return: converted sample values
+        :rtype: :class:`numpy.ndarray`
+        :raises ValueError: if a conversion function changes the shape of the \
+        values
+        """
+
+        for fcn in self.block_conversion_callbacks:
+            output = numpy.asarray(fcn(values), dtype=numpy.float64)
+
+            if output.shape != values.shape:
+                raise ValueError("Block conversion function returned values "
+                                 "with shape {0}, expected {1}".format(
+                                     output.shape, values.shape))
+
+            values = output
+
+        return values
+
+    def _set_channels(self, channels):
+        """Sets the stored channels and allocates sample value storage
+
+        :param channels: channels, in order
+        :type channels: List[int]
+        """
+
+        self.channels = list(channels)
+        self._values = numpy.zeros((self.max_size, len(self.channels)),
+                                   dtype=numpy.float64)
+
+    def _insert_block(self, times, values):
+        """Inserts a block of readings, overwriting the oldest readings when \
+        the datastore is full
+
+        The block is written with at most one wraparound, so the cost depends
+        only on the size of the block and not on the size of the datastore.
+
+        :param times: reading times, in chronological order
+        :type times: :class:`numpy.ndarray`
+        :param values: (time, channel) sample values
+        :type values: :class:`numpy.ndarray`
+        """
+
+        # only the latest readings fit
+        if len(times) > self.max_size:
+            times = times[len(times) - self.max_size:]
+            values = values[len(values) - self.max_size:]
+
+        count = len(times)
+
+        if not count:
+            return
+
+        # storage index after the latest reading
+        first = (self._head + self._count) % self.max_size
+
+        # number of readings that fit before the end of the storage arrays
+        fit = min(count, self.max_size - first)
+
+        self._times[first:first + fit] = times[:fit]
+        self._values[first:first + fit] = values[:fit]
+
+        # wrap the remainder around to the start of the storage arrays
+        if fit < count:
+            self._times[:count - fit] = times[fit:]
+            self._values[:count - fit] = values[fit:]
+
+        # number of oldest readings overwritten
+        overwritten = self._count + count - self.max_size
+
+        if overwritten > 0:
+            self._head = (self._head + overwritten) % self.max_size
+            self._count = self.max_size
+        else:
+            self._count += count
 
     def insert_from_dict_list(self, data, *args, **kwargs):
         """Inserts readings from the specified list of dict objects
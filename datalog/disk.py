@@ -0,0 +1,465 @@
+"""Persistent, memory-mapped datastore"""
+
+import os
+import json
+import bisect
+import logging
+
+import numpy
+
+from datalog.data import DataStore
+from datalog.pyramid import AggregateBlock
+
+# logger
+logger = logging.getLogger("datalog.disk")
+
+
+class DiskDataStore(DataStore):
+    """Datastore which appends readings to memory-mapped segment files
+
+    Each segment file holds a fixed number of fixed-width records, each an
+    int64 reading time followed by a float64 sample value per channel. Readings
+    are never discarded, and are found by bisecting the mapped reading times,
+    so the datastore can hold far more readings than fit in memory. Readings
+    stored in a directory are available again when a new datastore is created
+    for it.
+
+    Aggregates for :meth:`get_downsampled` are computed from the segment files
+    for the queried range, rather than kept in memory, so that opening the
+    datastore does not read its history.
+    """
+
+    # default number of readings per segment
+    DEFAULT_SEGMENT_SIZE = 86400
+
+    # segment file name format
+    SEGMENT_FORMAT = "{0:08d}.seg"
+
+    def __init__(self, path, segment_size=None, conversion_callbacks=None,
+                 block_conversion_callbacks=None, resolutions=None):
+        """Initialises the datastore
+
+        :param path: directory to store segment files in
+        :type path: str
+        :param segment_size: number of readings per segment file
+        :type segment_size: int
+        :param conversion_callbacks: list of methods to call on each reading's \
+        data
+        :param block_conversion_callbacks: list of methods to call on the \
+        (time, channel) array of sample values from each insert
+        :param resolutions: aggregate resolutions in ms, or None for \
+        :attr:`~datalog.data.DataStore.DEFAULT_RESOLUTIONS`
+        :type resolutions: List[int]
+        """
+
+        # no in-memory storage or aggregates
+        super(DiskDataStore, self).__init__(0, conversion_callbacks,
+                                            block_conversion_callbacks)
+
+        if resolutions is None:
+            resolutions = self.DEFAULT_RESOLUTIONS
+
+        self.resolutions = sorted(set(int(resolution)
+                                      for resolution in resolutions))
+
+        if segment_size is None:
+            segment_size = self.DEFAULT_SEGMENT_SIZE
+
+        self.path = path
+        self.segment_size = int(segment_size)
+
+        if self.segment_size < 1:
+            raise ValueError("Segment size must be at least 1")
+
+        # open segments, in order
+        self._segments = []
+
+        # index of the first reading in each segment
+        self._segment_starts = []
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self._open_segments()
+
+    @classmethod
+    def instance_from_json(cls, json_str, path, *args, **kwargs):
+        """Returns a new instance of the datastore using the specified JSON \
+        encoded data
+
+        :param json_str: JSON-encoded data
+        :param path: directory to store segment files in
+        :type path: str
+        """
+
+        # create a new instance
+        obj = cls(path, *args, **kwargs)
+
+        # set readings
+        obj.insert_from_dict_list(json.loads(json_str))
+
+        return obj
+
+    def instance_with_readings(self, readings, path):
+        """Returns a new instance of datastore with the specified readings
+
+        :param readings: list of readings
+        :param path: directory to store the new datastore's segment files in
+        :type path: str
+        """
+
+        # new object with the same segment size and resolutions
+        obj = self.__class__(path, self.segment_size,
+                             resolutions=self.resolutions)
+
+        # add the existing readings
+        obj.insert(readings)
+
+        return obj
+
+    def _open_segments(self):
+        """Opens existing segment files"""
+
+        names = sorted([name for name in os.listdir(self.path)
+                        if name.endswith(".seg")])
+
+        for name in names:
+            segment = Segment(os.path.join(self.path, name))
+
+            if self.channels is None:
+                self.channels = segment.channels
+            elif segment.channels != self.channels:
+                raise ValueError("Segment {0} channels do not match the "
+                                 "stored channels".format(name))
+
+            self._add_segment(segment)
+
+        if names:
+            logger.info("Opened %i readings in %i segments", self._count,
+                        len(names))
+
+    def _add_segment(self, segment):
+        self._segment_starts.append(self._count)
+        self._segments.append(segment)
+        self._count += segment.count
+
+    def _new_segment(self):
+        """Creates a new segment file after the last
+
+        The file is numbered after the last segment file rather than by the
+        number of segments, as earlier files may have been deleted.
+        """
+
+        if self._segments:
+            name = os.path.basename(self._segments[-1].path)
+            index = int(os.path.splitext(name)[0]) + 1
+        else:
+            index = 0
+
+        path = os.path.join(self.path, self.SEGMENT_FORMAT.format(index))
+
+        self._add_segment(Segment(path, self.channels, self.segment_size))
+
+    def _set_channels(self, channels):
+        self.channels = list(channels)
+
+    def _insert_block(self, times, values):
+        count = len(times)
+        written = 0
+
+        while written < count:
+            if not self._segments or self._segments[-1].is_full():
+                self._new_segment()
+
+            n = self._segments[-1].append(times[written:],
+                                          values[written:])
+
+            written += n
+            self._count += n
+
+    def _last_time(self):
+        if not self._count:
+            return None
+
+        return self._segments[-1].last_time()
+
+    def _get_block(self, start, stop):
+        """Gets the times and values of a range of stored readings
+
+        The returned arrays are views of the mapped segment files unless the
+        range spans more than one segment, in which case they are copies.
+        """
+
+        if stop <= start:
+            return (numpy.empty(0, dtype=numpy.int64),
+                    numpy.empty((0, len(self.channels or [])),
+                                dtype=numpy.float64))
+
+        # segments containing the first and last readings
+        first = bisect.bisect_right(self._segment_starts, start) - 1
+        last = bisect.bisect_right(self._segment_starts, stop - 1) - 1
+
+        parts = []
+
+        for index in range(first, last + 1):
+            offset = self._segment_starts[index]
+            segment = self._segments[index]
+
+            part = slice(max(start - offset, 0),
+                         min(stop - offset, segment.count))
+
+            parts.append((segment.times[part], segment.values[part]))
+
+        if len(parts) == 1:
+            return parts[0]
+
+        return (numpy.concatenate([times for times, _ in parts]),
+                numpy.concatenate([values for _, values in parts]))
+
+    def _search(self, reading_time, side="left"):
+        # segments are in order, so find the first segment whose last time
+        # could be after the reading time
+        last_times = [segment.last_time() for segment in self._segments
+                      if segment.count]
+
+        if side == "left":
+            index = bisect.bisect_left(last_times, reading_time)
+        else:
+            index = bisect.bisect_right(last_times, reading_time)
+
+        if index == len(last_times):
+            return self._count
+
+        segment = self._segments[index]
+
+        return self._segment_starts[index] + int(numpy.searchsorted(
+            segment.times[:segment.count], reading_time, side=side))
+
+    def get_downsampled(self, points, channels=None, start=None, end=None):
+        """Get aggregates of the readings in the half-open time range \
+        [start, end) at the coarsest resolution giving at least the specified \
+        number of points
+
+        The aggregates are computed from the stored readings in chunks of
+        whole intervals. If no resolution is fine enough, the readings are
+        returned as one aggregate each.
+
+        :param points: minimum number of points, e.g. the width of a plot
+        :type points: int
+        :param channels: channels to return aggregates for, in order, or None \
+        for all channels
+        :type channels: List[int]
+        :param start: earliest time, or None for the earliest reading
+        :type start: int
+        :param end: time after the last reading, or None for after the latest \
+        reading
+        :type end: int
+        :return: aggregates
+        :rtype: :class:`~datalog.pyramid.AggregateBlock`
+        :raises ValueError: if a specified channel is not stored
+        """
+
+        with self._lock:
+            if channels is None:
+                columns = slice(None)
+                channels = self.channels or []
+            else:
+                columns = self._channel_columns(channels)
+
+            first, stop = self._range_indices(start, end)
+
+            if first == stop:
+                return AggregateBlock.instance_from_values(
+                    [], channels, numpy.empty((0, len(channels))))
+
+            # limit to the times held
+            if start is None:
+                start = int(self._get_block(first, first + 1)[0][0])
+
+            if end is None:
+                end = self._last_time() + 1
+
+            start = int(start)
+            end = int(end)
+
+            resolutions = [resolution for resolution in self.resolutions
+                           if (end - start) // resolution >= int(points)]
+
+            if not resolutions:
+                times, values = self._get_block(first, stop)
+
+                return AggregateBlock.instance_from_values(
+                    times, channels, values[:, columns])
+
+            resolution = resolutions[-1]
+
+            # include the whole intervals holding the start and end
+            first, stop = self._range_indices(
+                start // resolution * resolution,
+                -(-end // resolution) * resolution)
+
+            blocks = [AggregateBlock.instance_from_readings(
+                          times, channels, values[:, columns], resolution)
+                      for times, values in self._iter_interval_blocks(
+                          first, stop, resolution)]
+
+            return AggregateBlock.instance_from_blocks(blocks)
+
+    def _iter_interval_blocks(self, first, stop, resolution):
+        """Iterates over the times and values of a range of stored readings \
+        in chunks holding whole intervals of the specified length"""
+
+        while first < stop:
+            end = min(first + self.DEFAULT_CHUNK_SIZE, stop)
+
+            if end < stop:
+                # end the chunk at the start of the interval holding its last
+                # reading, unless the interval holds the whole chunk
+                interval = int(self._get_block(end, end + 1)[0][0]) \
+                           // resolution * resolution
+                aligned = self._search(interval)
+
+                if aligned <= first:
+                    aligned = min(self._search(interval + resolution), stop)
+
+                end = aligned
+
+            yield self._get_block(first, end)
+
+            first = end
+
+    def flush(self):
+        """Writes changes to the segment files to disk"""
+
+        with self._lock:
+            for segment in self._segments:
+                segment.flush()
+
+    def close(self):
+        """Flushes and closes the segment files"""
+
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+
+            self._segments = []
+            self._segment_starts = []
+            self._count = 0
+
+
+class Segment(object):
+    """Memory-mapped file of fixed-width reading records
+
+    The file starts with a header of int64 values: an identifier, the number
+    of channels, the number of records the file can hold, the number of records
+    written and the channels. The records follow.
+    """
+
+    ID = 0x444c5347
+
+    # header fields before the channels
+    _ID = 0
+    _CHANNEL_COUNT = 1
+    _CAPACITY = 2
+    _COUNT = 3
+    HEADER_LEN = 4
+
+    def __init__(self, path, channels=None, capacity=None):
+        """Opens a segment file, or creates one if channels are specified
+
+        :param path: file path
+        :type path: str
+        :param channels: channels, to create a new file
+        :type channels: List[int]
+        :param capacity: number of records, to create a new file
+        :type capacity: int
+        :raises ValueError: if an existing file is not a segment file
+        """
+
+        self.path = path
+
+        if channels is not None:
+            channels = list(channels)
+            capacity = int(capacity)
+
+            header = numpy.array([self.ID, len(channels), capacity, 0]
+                                 + channels, dtype="<i8")
+            size = header.nbytes + capacity * 8 * (1 + len(channels))
+
+            # create the file at its full size, never replacing a file
+            with open(path, "xb") as obj:
+                obj.write(header.tobytes())
+                obj.truncate(size)
+        else:
+            header = numpy.fromfile(path, dtype="<i8", count=self.HEADER_LEN)
+
+            if len(header) < self.HEADER_LEN or header[self._ID] != self.ID:
+                raise ValueError("{0} is not a segment file".format(path))
+
+        n_channels = int(header[self._CHANNEL_COUNT])
+
+        self._map = numpy.memmap(path, dtype="<i8", mode="r+")
+
+        self._header = self._map[:self.HEADER_LEN + n_channels]
+        self.channels = self._header[self.HEADER_LEN:].tolist()
+
+        records = self._map[self.HEADER_LEN + n_channels:].view(
+            [("time", "<i8"), ("values", "<f8", (n_channels,))])
+
+        self.times = records["time"]
+        self.values = records["values"]
+
+    @property
+    def capacity(self):
+        """Number of records the file can hold"""
+        return int(self._header[self._CAPACITY])
+
+    @property
+    def count(self):
+        """Number of records written"""
+        return int(self._header[self._COUNT])
+
+    def is_full(self):
+        """Checks if the file is full"""
+        return self.count >= self.capacity
+
+    def last_time(self):
+        """Gets the time of the last record, or None if there are none"""
+
+        if not self.count:
+            return None
+
+        return int(self.times[self.count - 1])
+
+    def append(self, times, values):
+        """Appends as many of the specified readings as fit
+
+        :param times: reading times
+        :type times: :class:`numpy.ndarray`
+        :param values: (time, channel) sample values
+        :type values: :class:`numpy.ndarray`
+        :return: number of readings appended
+        :rtype: int
+        """
+
+        count = self.count
+        n = min(len(times), self.capacity - count)
+
+        self.times[count:count + n] = times[:n]
+        self.values[count:count + n] = values[:n]
+
+        # update the count once the records are written
+        self._header[self._COUNT] = count + n
+
+        return n
+
+    def flush(self):
+        """Writes changes to disk"""
+        self._map.flush()
+
+    def close(self):
+        """Flushes and closes the file"""
+
+        self.flush()
+
+        self._header = self.times = self.values = self._map = None
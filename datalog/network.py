@@ -0,0 +1,232 @@
+"""HTTP server for datastore contents
+
+The server answers GET requests to ``/`` with readings from a
+:class:`~datalog.data.DataStore`. The following query parameters are supported:
+
+* ``amount``: maximum number of readings to return
+* ``desc``: return the latest readings (``true``) or earliest (``false``)
+* ``pivot_time``, ``pivot_after``: as :meth:`~datalog.data.DataStore.get_readings`
+* ``start``, ``end``: half-open time range of readings to return
+* ``format``: ``json``, ``csv``, ``binary`` or ``compressed`` (see
+  :mod:`~datalog.codec`)
+
+Limits and defaults are taken from the ``[server]`` config section. Requests
+are handled by a bounded pool of worker threads, so clients can read
+concurrently without blocking the thread inserting readings.
+"""
+
+import logging
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from datalog import codec
+from datalog.data import DataStore
+from datalog.adc.adc import Adc
+
+# logger
+logger = logging.getLogger("datalog.network")
+
+
+class DataRequestHandler(BaseHTTPRequestHandler):
+    """Handler for datastore requests"""
+
+    # content types of supported formats
+    CONTENT_TYPES = {
+        "json": "application/json",
+        "csv": "text/csv",
+        "binary": "application/octet-stream",
+        "compressed": "application/octet-stream"
+    }
+
+    def setup(self):
+        # buffer responses in chunks of the configured socket buffer length
+        self.wbufsize = self.server.socket_buf_len
+
+        super(DataRequestHandler, self).setup()
+
+    def do_GET(self):
+        """Handles a GET request"""
+
+        url = urlsplit(self.path)
+
+        if url.path != "/":
+            self.send_error(404)
+            return
+
+        try:
+            fmt, options = self.server.parse_query(parse_qs(url.query))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        # get readings
+        block = self.server.datastore.get_reading_block(**options)
+
+        if fmt == "json":
+            body = block.json_repr().encode("utf-8")
+        elif fmt == "csv":
+            body = block.csv_repr().encode("utf-8")
+        elif fmt == "binary":
+            body = block.binary_repr()
+        else:
+            body = codec.encode_block(block)
+
+        self.send_response(200)
+        self.send_header("Content-Type", self.CONTENT_TYPES[fmt])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class DataServer(HTTPServer):
+    """HTTP server for datastore contents, handling requests in a bounded \
+    pool of worker threads"""
+
+    def __init__(self, datastore, config,
+                 handler_class=DataRequestHandler):
+        """Initialises the server
+
+        :param datastore: the datastore to serve readings from
+        :type datastore: :class:`~datalog.data.DataStore`
+        :param config: configuration class
+        :param handler_class: request handler class
+        """
+
+        self.datastore = datastore
+
+        server_config = config['server']
+
+        self.max_connections = int(server_config['max_connections'])
+        self.socket_buf_len = int(server_config['socket_buf_len'])
+        self.default_amount = int(server_config['default_readings_per_request'])
+        self.max_amount = int(server_config['max_readings_per_request'])
+        self.default_format = server_config['default_format']
+
+        if self.max_connections < 1:
+            raise ValueError("Maximum connections must be at least 1")
+
+        if self.default_format not in handler_class.CONTENT_TYPES:
+            raise ValueError("Unrecognised default format")
+
+        # connections waiting to be accepted
+        self.request_queue_size = self.max_connections
+
+        # worker pool, and count of free workers so that connections wait to
+        # be accepted rather than queueing without limit
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_connections,
+            thread_name_prefix="datalog-server")
+        self._free_workers = threading.BoundedSemaphore(self.max_connections)
+
+        super(DataServer, self).__init__(
+            (server_config['host'], int(server_config['port'])), handler_class)
+
+        logger.info("Server listening on %s:%i", *self.server_address[:2])
+
+    def process_request(self, request, client_address):
+        """Handles the request in a worker thread"""
+
+        # wait for a free worker
+        self._free_workers.acquire()
+
+        try:
+            self._executor.submit(self._process_request_worker, request,
+                                  client_address)
+        except:
+            self._free_workers.release()
+            raise
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free_workers.release()
+
+    def server_close(self):
+        super(DataServer, self).server_close()
+
+        # wait for running requests to finish
+        self._executor.shutdown(wait=True)
+
+    def parse_query(self, query):
+        """Parses request query parameters into a format and datastore options
+
+        :param query: query parameters, as returned by \
+        :func:`urllib.parse.parse_qs`
+        :type query: Dict[str, List[str]]
+        :return: format and :meth:`~datalog.data.DataStore.get_reading_block` \
+        options
+        :rtype: Tuple[str, Dict]
+        :raises ValueError: if a parameter is invalid
+        """
+
+        def get(name, parser, default=None):
+            if name not in query:
+                return default
+
+            try:
+                return parser(query[name][-1])
+            except ValueError:
+                raise ValueError("Invalid {0}".format(name))
+
+        def parse_bool(value):
+            value = value.lower()
+
+            if value in ("1", "true", "yes"):
+                return True
+            elif value in ("0", "false", "no"):
+                return False
+
+            raise ValueError()
+
+        fmt = get("format", str, self.default_format)
+
+        if fmt not in DataRequestHandler.CONTENT_TYPES:
+            raise ValueError("Unrecognised format")
+
+        # amount cannot exceed maximum
+        amount = min(get("amount", int, self.default_amount), self.max_amount)
+
+        options = {
+            "amount": amount,
+            "desc": get("desc", parse_bool, False),
+            "pivot_time": get("pivot_time", int),
+            "pivot_after": get("pivot_after", parse_bool, True),
+            "start": get("start", int),
+            "end": get("end", int)
+        }
+
+        return fmt, options
+
+
+def run_server(config, datastore=None):
+    """Runs the ADC specified in the config and serves its readings until \
+    interrupted
+
+    :param config: configuration class
+    :param datastore: the datastore to store readings in, or None to create one
+    :type datastore: :class:`~datalog.data.DataStore`
+    """
+
+    if datastore is None:
+        datastore = DataStore()
+
+    adc = Adc.load_from_config(config)
+
+    with adc.get_retriever(datastore):
+        server = DataServer(datastore, config)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Server interrupted")
+        finally:
+            server.server_close()
@@ -0,0 +1,425 @@
+"""Multi-resolution aggregates of readings
+
+A :class:`Pyramid` holds the count, minimum, maximum and sum of each channel's
+sample values over fixed time intervals at several resolutions, e.g. 10 s,
+1 min, 10 min and 1 h. Batches of inserted readings update every level with
+a few vectorised operations, so long time ranges can be summarised, e.g.
+for plotting, at a cost depending on the number of intervals rather than the
+number of readings.
+"""
+
+import logging
+
+import numpy
+
+# logger
+logger = logging.getLogger("datalog.pyramid")
+
+
+class AggregateBlock(object):
+    """Class to represent aggregates of readings over consecutive time \
+    intervals"""
+
+    def __init__(self, times, channels, counts, mins, maxs, means,
+                 resolution=None, stds=None):
+        """Initialises an aggregate block
+
+        :param times: start time of each interval, or reading times for raw \
+        readings
+        :param channels: channels, in order
+        :param counts: (time, channel) number of non-NaN values in each interval
+        :param mins: (time, channel) minimum values
+        :param maxs: (time, channel) maximum values
+        :param means: (time, channel) mean values
+        :param resolution: interval length in ms, or None for raw readings
+        :type resolution: int
+        :param stds: (time, channel) standard deviations, or None if not \
+        computed
+        """
+
+        self.times = times
+        self.channels = list(channels)
+        self.counts = counts
+        self.mins = mins
+        self.maxs = maxs
+        self.means = means
+        self.resolution = resolution
+        self.stds = stds
+
+    def __len__(self):
+        """Number of intervals in this block"""
+        return len(self.times)
+
+    def __repr__(self):
+        return "AggregateBlock({0} intervals, resolution {1})".format(
+            len(self), self.resolution)
+
+    @classmethod
+    def instance_from_values(cls, times, channels, values):
+        """Returns a new block with one interval per raw reading
+
+        :param times: reading times
+        :param channels: channels, in order
+        :param values: (time, channel) sample values
+        """
+
+        values = numpy.array(values, dtype=numpy.float64)
+
+        counts = (~numpy.isnan(values)).astype(numpy.int64)
+
+        return cls(numpy.array(times, dtype=numpy.int64), channels, counts,
+                   values, values.copy(), values.copy(),
+                   stds=numpy.where(counts > 0, 0, numpy.nan))
+
+    @classmethod
+    def instance_from_readings(cls, times, channels, values, resolution):
+        """Returns a new block aggregating readings over intervals of the \
+        specified length
+
+        All aggregates are computed in one pass over the readings. NaN values
+        are ignored, and aggregates of intervals with no values are NaN.
+        Intervals with no readings are omitted.
+
+        :param times: reading times, in chronological order
+        :param channels: channels, in order
+        :param values: (time, channel) sample values
+        :param resolution: interval length, in ms
+        :type resolution: int
+        """
+
+        resolution = int(resolution)
+
+        if resolution <= 0:
+            raise ValueError("Resolution must be positive")
+
+        times = numpy.asarray(times, dtype=numpy.int64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+
+        if not len(times):
+            empty = numpy.empty((0, values.shape[1]))
+
+            return cls(times, channels, empty.astype(numpy.int64), empty,
+                       empty, empty, resolution, empty)
+
+        intervals, firsts = get_intervals(times, resolution)
+
+        valid = ~numpy.isnan(values)
+
+        counts = numpy.add.reduceat(valid, firsts, axis=0)
+        mins = numpy.fmin.reduceat(values, firsts, axis=0)
+        maxs = numpy.fmax.reduceat(values, firsts, axis=0)
+
+        # shift values by the minimum of each interval, so that the variance
+        # is not lost to cancellation when values are large
+        lengths = numpy.diff(numpy.append(firsts, len(times)))
+        shifts = numpy.nan_to_num(mins)
+        shifted = numpy.where(valid, values - numpy.repeat(shifts, lengths,
+                                                           axis=0), 0)
+
+        sums = numpy.add.reduceat(shifted, firsts, axis=0)
+        squares = numpy.add.reduceat(shifted ** 2, firsts, axis=0)
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+            variances = numpy.maximum(squares / counts - means ** 2, 0)
+
+        return cls(intervals, channels, counts, mins, maxs, means + shifts,
+                   resolution, numpy.sqrt(variances))
+
+    @classmethod
+    def instance_from_blocks(cls, blocks):
+        """Returns a new block joining the specified blocks
+
+        :param blocks: blocks with the same channels and resolution, in \
+        chronological order and with no interval in more than one block
+        :type blocks: List[:class:`AggregateBlock`]
+        """
+
+        blocks = list(blocks)
+
+        if len(blocks) == 1:
+            return blocks[0]
+
+        stds = None
+
+        if all(block.stds is not None for block in blocks):
+            stds = numpy.concatenate([block.stds for block in blocks])
+
+        return cls(numpy.concatenate([block.times for block in blocks]),
+                   blocks[0].channels,
+                   numpy.concatenate([block.counts for block in blocks]),
+                   numpy.concatenate([block.mins for block in blocks]),
+                   numpy.concatenate([block.maxs for block in blocks]),
+                   numpy.concatenate([block.means for block in blocks]),
+                   blocks[0].resolution, stds)
+
+
+def get_intervals(times, resolution):
+    """Finds the intervals of the specified length holding the specified \
+    reading times
+
+    :param times: reading times, in chronological order
+    :type times: :class:`numpy.ndarray`
+    :param resolution: interval length, in ms
+    :type resolution: int
+    :return: start time of each interval holding readings, and the index of \
+    its first reading
+    :rtype: Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+    """
+
+    # intervals are computed arithmetically from the reading times
+    intervals = times // resolution * resolution
+    firsts = numpy.concatenate([[0], numpy.flatnonzero(
+        numpy.diff(intervals)) + 1])
+
+    return intervals[firsts], firsts
+
+
+class PyramidLevel(object):
+    """Aggregates at one resolution
+
+    Intervals are held in contiguous arrays, in chronological order, so that
+    they can be found by bisection. Once the arrays fill, the oldest intervals
+    are discarded, keeping at least ``size`` intervals.
+    """
+
+    def __init__(self, resolution, size):
+        """Initialises the level
+
+        :param resolution: interval length, in ms
+        :type resolution: int
+        :param size: minimum number of intervals to keep
+        :type size: int
+        """
+
+        self.resolution = int(resolution)
+        self.size = int(size)
+
+        if self.resolution <= 0:
+            raise ValueError("Resolution must be positive")
+
+        if self.size < 1:
+            raise ValueError("Size must be at least 1")
+
+        # number of intervals held
+        self.count = 0
+
+        # storage, allocated once the number of channels is known
+        self.times = None
+        self.counts = None
+        self.mins = None
+        self.maxs = None
+        self.sums = None
+
+    def _allocate(self, n_channels):
+        # twice the size, so that the oldest intervals only need discarding
+        # once every size intervals
+        capacity = 2 * self.size
+
+        self.times = numpy.zeros(capacity, dtype=numpy.int64)
+        self.counts = numpy.zeros((capacity, n_channels), dtype=numpy.int64)
+        self.mins = numpy.zeros((capacity, n_channels), dtype=numpy.float64)
+        self.maxs = numpy.zeros((capacity, n_channels), dtype=numpy.float64)
+        self.sums = numpy.zeros((capacity, n_channels), dtype=numpy.float64)
+
+    def _arrays(self):
+        return [self.times, self.counts, self.mins, self.maxs, self.sums]
+
+    def insert(self, times, values):
+        """Adds readings to the aggregates
+
+        :param times: reading times, in chronological order and later than \
+        previously inserted readings
+        :type times: :class:`numpy.ndarray`
+        :param values: (time, channel) sample values
+        :type values: :class:`numpy.ndarray`
+        """
+
+        if not len(times):
+            return
+
+        if self.times is None:
+            self._allocate(values.shape[1])
+
+        times, firsts = get_intervals(times, self.resolution)
+
+        # aggregate each interval, ignoring NaN
+        valid = ~numpy.isnan(values)
+
+        counts = numpy.add.reduceat(valid, firsts, axis=0)
+        mins = numpy.fmin.reduceat(values, firsts, axis=0)
+        maxs = numpy.fmax.reduceat(values, firsts, axis=0)
+        sums = numpy.add.reduceat(numpy.where(valid, values, 0), firsts, axis=0)
+
+        # merge the first interval into the latest held interval if they match
+        if self.count and self.times[self.count - 1] == times[0]:
+            last = self.count - 1
+
+            self.counts[last] += counts[0]
+            self.mins[last] = numpy.fmin(self.mins[last], mins[0])
+            self.maxs[last] = numpy.fmax(self.maxs[last], maxs[0])
+            self.sums[last] += sums[0]
+
+            times, counts, mins, maxs, sums = \
+                times[1:], counts[1:], mins[1:], maxs[1:], sums[1:]
+
+        new = len(times)
+
+        if not new:
+            return
+
+        # only the latest intervals fit
+        if new > len(self.times):
+            skip = new - len(self.times)
+            times, counts, mins, maxs, sums = \
+                times[skip:], counts[skip:], mins[skip:], maxs[skip:], \
+                sums[skip:]
+            new = len(times)
+
+        # discard the oldest intervals to make space
+        if self.count + new > len(self.times):
+            keep = max(self.size, new) - new
+            keep = min(keep, self.count)
+
+            for array in self._arrays():
+                array[:keep] = array[self.count - keep:self.count]
+
+            self.count = keep
+
+        for array, source in zip(self._arrays(),
+                                 [times, counts, mins, maxs, sums]):
+            array[self.count:self.count + new] = source
+
+        self.count += new
+
+    def get(self, start=None, end=None, columns=None):
+        """Gets aggregates of intervals starting in the half-open time range \
+        [start, end)
+
+        :param start: earliest interval start time, or None for no limit
+        :type start: int
+        :param end: time after the last interval start, or None for no limit
+        :type end: int
+        :param columns: channel columns, or None for all
+        :return: copies of the interval start times, counts, minimums, \
+        maximums and means
+        :rtype: Tuple[:class:`numpy.ndarray`, ...]
+        """
+
+        times = self.times[:self.count]
+
+        first = 0 if start is None else \
+            numpy.searchsorted(times, start // self.resolution
+                               * self.resolution)
+        last = self.count if end is None else numpy.searchsorted(times, end)
+
+        if columns is None:
+            columns = slice(None)
+
+        counts = self.counts[first:last, columns]
+        sums = self.sums[first:last, columns]
+
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+
+        return (times[first:last].copy(), counts.copy(),
+                self.mins[first:last, columns].copy(),
+                self.maxs[first:last, columns].copy(), means)
+
+    def first_time(self):
+        """Start time of the earliest held interval, or None if there are \
+        none"""
+
+        if not self.count:
+            return None
+
+        return int(self.times[0])
+
+
+class Pyramid(object):
+    """Aggregates of readings at several resolutions
+
+    Inserted readings are buffered and added to the aggregates in batches, or
+    before the aggregates are read, so that frequent small inserts share the
+    cost of updating each level.
+    """
+
+    # number of buffered readings at which the aggregates are updated
+    BATCH_SIZE = 1000
+
+    def __init__(self, resolutions, size):
+        """Initialises the pyramid
+
+        :param resolutions: interval lengths, in ms
+        :type resolutions: List[int]
+        :param size: minimum number of intervals to keep at each resolution
+        :type size: int
+        """
+
+        self.levels = [PyramidLevel(resolution, size)
+                       for resolution in sorted(set(resolutions))]
+
+        # readings not yet added to the aggregates
+        self._pending_times = []
+        self._pending_values = []
+        self._pending_count = 0
+
+    def insert(self, times, values):
+        """Adds readings to the aggregates at each resolution
+
+        :param times: reading times, in chronological order and later than \
+        previously inserted readings
+        :type times: :class:`numpy.ndarray`
+        :param values: (time, channel) sample values
+        :type values: :class:`numpy.ndarray`
+        """
+
+        if not self.levels:
+            return
+
+        self._pending_times.append(numpy.array(times))
+        self._pending_values.append(numpy.array(values))
+        self._pending_count += len(times)
+
+        if self._pending_count >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Adds buffered readings to the aggregates"""
+
+        if not self._pending_count:
+            return
+
+        times = numpy.concatenate(self._pending_times)
+        values = numpy.concatenate(self._pending_values)
+
+        self._pending_times = []
+        self._pending_values = []
+        self._pending_count = 0
+
+        for level in self.levels:
+            level.insert(times, values)
+
+    def get_level(self, points, start, end):
+        """Gets the coarsest level with at least the specified number of \
+        intervals in the half-open time range [start, end)
+
+        Buffered readings are first added to the aggregates.
+
+        :param points: number of intervals
+        :type points: int
+        :param start: earliest time
+        :type start: int
+        :param end: time after the last interval
+        :type end: int
+        :return: level, or None if no level is fine enough
+        :rtype: :class:`PyramidLevel`
+        """
+
+        self.flush()
+
+        for level in reversed(self.levels):
+            if (end - start) // level.resolution >= points:
+                return level
+
+        return None
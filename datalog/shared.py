@@ -0,0 +1,379 @@
+"""Shared memory ring buffer for readings
+
+A :class:`SharedRingBuffer` holds the latest readings in a
+:mod:`multiprocessing.shared_memory` segment, written by one process and read
+by any number of processes. The segment holds a header, the channels, the
+reading times and the sample values, all as arrays that readers can view
+without copying.
+
+Readings are numbered in the order they are written. Each
+:class:`SharedRingReader` keeps a cursor holding the number of the next
+reading to read, and counts readings overwritten by the writer before they
+could be read.
+"""
+
+import sys
+import logging
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy
+
+from datalog.data import ReadingBlock
+
+# logger
+logger = logging.getLogger("datalog.shared")
+
+
+class SharedRingBuffer(object):
+    """Ring buffer of readings in shared memory"""
+
+    # header identifier
+    ID = 0x444c5242
+
+    # header fields
+    _ID = 0
+    _CAPACITY = 1
+    _MAX_CHANNELS = 2
+    _CHANNEL_COUNT = 3
+    # number of readings written
+    _WRITTEN = 4
+    # number of readings written once the current write completes
+    _WRITING = 5
+    HEADER_LEN = 8
+
+    def __init__(self, shm, owner=False):
+        """Initialises the ring buffer from a shared memory segment
+
+        Use :meth:`create` or :meth:`attach` rather than calling this directly.
+
+        :param shm: shared memory segment
+        :type shm: :class:`multiprocessing.shared_memory.SharedMemory`
+        :param owner: whether this instance created the segment
+        :type owner: bool
+        :raises ValueError: if the segment is not a ring buffer
+        """
+
+        self.shm = shm
+        self.owner = bool(owner)
+
+        self._header = numpy.ndarray(self.HEADER_LEN, dtype=numpy.int64,
+                                     buffer=shm.buf)
+
+        if not owner and self._header[self._ID] != self.ID:
+            raise ValueError("Shared memory is not a ring buffer")
+
+        capacity = int(self._header[self._CAPACITY])
+        max_channels = int(self._header[self._MAX_CHANNELS])
+
+        offset = self._header.nbytes
+        self._channels = numpy.ndarray(max_channels, dtype=numpy.int64,
+                                       buffer=shm.buf, offset=offset)
+
+        offset += self._channels.nbytes
+        self._times = numpy.ndarray(capacity, dtype=numpy.int64,
+                                    buffer=shm.buf, offset=offset)
+
+        offset += self._times.nbytes
+        self._values = numpy.ndarray((capacity, max_channels),
+                                     dtype=numpy.float64, buffer=shm.buf,
+                                     offset=offset)
+
+    @classmethod
+    def create(cls, capacity, max_channels, name=None):
+        """Creates a new ring buffer
+
+        :param capacity: number of readings to hold
+        :type capacity: int
+        :param max_channels: maximum number of channels per reading
+        :type max_channels: int
+        :param name: shared memory name, or None to generate one
+        :type name: str
+        """
+
+        capacity = int(capacity)
+        max_channels = int(max_channels)
+
+        if capacity < 1 or max_channels < 1:
+            raise ValueError("Capacity and maximum channels must be at least 1")
+
+        size = 8 * (cls.HEADER_LEN + max_channels + capacity
+                    * (1 + max_channels))
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = numpy.ndarray(cls.HEADER_LEN, dtype=numpy.int64,
+                               buffer=shm.buf)
+        header[:] = 0
+        header[cls._CAPACITY] = capacity
+        header[cls._MAX_CHANNELS] = max_channels
+        header[cls._ID] = cls.ID
+        del header
+
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attaches to an existing ring buffer
+
+        The segment is not tracked by this process, so that it is only
+        unlinked by its creator, and not when an attached process exits.
+
+        :param name: shared memory name
+        :type name: str
+        """
+
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+
+            # attaching registers the segment with this process's resource
+            # tracker, which would unlink it when this process exits
+            resource_tracker.unregister(shm._name, "shared_memory")
+
+        return cls(shm)
+
+    @property
+    def name(self):
+        """Shared memory name, used to attach from other processes"""
+        return self.shm.name
+
+    @property
+    def capacity(self):
+        """Number of readings held"""
+        return len(self._times)
+
+    @property
+    def channels(self):
+        """Channels, in order, or None if not yet set"""
+
+        count = int(self._header[self._CHANNEL_COUNT])
+
+        if not count:
+            return None
+
+        return self._channels[:count].tolist()
+
+    @property
+    def written(self):
+        """Number of readings written"""
+        return int(self._header[self._WRITTEN])
+
+    @property
+    def times(self):
+        """View of the reading times in storage order"""
+        return self._times
+
+    @property
+    def values(self):
+        """View of the (time, channel) sample values in storage order"""
+        return self._values[:, :len(self.channels or [])]
+
+    def set_channels(self, channels):
+        """Sets the channels of the readings to be written
+
+        :param channels: channels, in order
+        :type channels: List[int]
+        :raises ValueError: if there are too many channels, or channels are \
+        already set to different values
+        """
+
+        channels = list(channels)
+
+        if len(channels) > len(self._channels):
+            raise ValueError("Too many channels for ring buffer")
+
+        existing = self.channels
+
+        if existing is not None:
+            if existing != channels:
+                raise ValueError("Ring buffer channels already set")
+
+            return
+
+        self._channels[:len(channels)] = channels
+        self._header[self._CHANNEL_COUNT] = len(channels)
+
+    def insert(self, readings):
+        """Writes the specified readings, overwriting the oldest
+
+        Only one process may write to the buffer.
+
+        :param readings: list of readings, or block of readings, to write
+        :type readings: List[:class:`~datalog.data.Reading`] or \
+        :class:`~datalog.data.ReadingBlock`
+        :raises ValueError: if the readings' channels differ from the buffer's
+        """
+
+        if not isinstance(readings, ReadingBlock):
+            readings = ReadingBlock.instance_from_readings(readings)
+
+        count = len(readings)
+
+        if not count:
+            return
+
+        self.set_channels(readings.channels)
+
+        times = readings.reading_times
+        values = readings.values
+
+        # only the latest readings fit
+        if count > self.capacity:
+            times = times[count - self.capacity:]
+            values = values[count - self.capacity:]
+
+        written = self.written
+        n_channels = values.shape[1]
+
+        # mark the slots about to be overwritten
+        self._header[self._WRITING] = written + count
+
+        for part, source in self._slices(written + count - len(times),
+                                         written + count):
+            self._times[part] = times[source]
+            self._values[part, :n_channels] = values[source]
+
+        self._header[self._WRITTEN] = written + count
+
+    def _slices(self, start, stop):
+        """Maps a range of reading numbers onto storage slices
+
+        :return: storage slices and corresponding slices of the range
+        :rtype: List[Tuple[slice, slice]]
+        """
+
+        first = start % self.capacity
+        length = stop - start
+
+        if first + length <= self.capacity:
+            return [(slice(first, first + length), slice(0, length))]
+
+        split = self.capacity - first
+
+        return [(slice(first, self.capacity), slice(0, split)),
+                (slice(0, length - split), slice(split, length))]
+
+    def reader(self, from_start=False):
+        """Creates a reader for this buffer
+
+        :param from_start: read from the oldest held reading rather than only \
+        readings written from now on
+        :type from_start: bool
+        :rtype: :class:`SharedRingReader`
+        """
+
+        if from_start:
+            cursor = max(self.written - self.capacity, 0)
+        else:
+            cursor = self.written
+
+        return SharedRingReader(self, cursor)
+
+    def close(self):
+        """Closes this process's access to the buffer"""
+
+        # release views of the shared memory before closing it
+        self._header = self._channels = self._times = self._values = None
+
+        self.shm.close()
+
+    def unlink(self):
+        """Destroys the buffer once all processes have closed it"""
+
+        if sys.version_info < (3, 13):
+            # a process attached with the same resource tracker, e.g. a forked
+            # reader, unregisters the segment, so register it again for
+            # unlinking to unregister
+            resource_tracker.register(self.shm._name, "shared_memory")
+
+        self.shm.unlink()
+
+
+class SharedRingReader(object):
+    """Reads readings from a :class:`SharedRingBuffer` from a cursor"""
+
+    def __init__(self, ring, cursor):
+        """Initialises the reader
+
+        :param ring: ring buffer to read
+        :type ring: :class:`SharedRingBuffer`
+        :param cursor: number of the next reading to read
+        :type cursor: int
+        """
+
+        self.ring = ring
+        self.cursor = int(cursor)
+
+        # number of readings overwritten before they could be read
+        self.overruns = 0
+
+    @property
+    def available(self):
+        """Number of readings written since the cursor, including any \
+        overwritten"""
+        return self.ring.written - self.cursor
+
+    def read(self, max_readings=None, copy=True):
+        """Reads readings from the cursor and advances it
+
+        Readings overwritten before they could be read are skipped and counted
+        in :attr:`overruns`.
+
+        :param max_readings: maximum number of readings to read, or None for \
+        all available
+        :type max_readings: int
+        :param copy: copy the readings; if False, and the readings do not wrap \
+        around the end of the buffer, the block views the shared memory and \
+        can be overwritten by later writes
+        :type copy: bool
+        :return: readings
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        ring = self.ring
+        written = ring.written
+        start = self.cursor
+
+        # skip overwritten readings
+        if written - start > ring.capacity:
+            self._overrun(written - ring.capacity - start)
+            start = written - ring.capacity
+
+        stop = written
+
+        if max_readings is not None:
+            stop = min(stop, start + int(max_readings))
+
+        channels = ring.channels or []
+        n_channels = len(channels)
+
+        parts = [(ring.times[part], ring.values[part, :n_channels])
+                 for part, _ in ring._slices(start, stop)] if stop > start \
+                else []
+
+        if len(parts) == 1 and not copy:
+            times, values = parts[0]
+        elif parts:
+            times = numpy.concatenate([times for times, _ in parts])
+            values = numpy.concatenate([values for _, values in parts])
+        else:
+            times = numpy.empty(0, dtype=numpy.int64)
+            values = numpy.empty((0, n_channels))
+
+        # readings before this were being overwritten while they were copied
+        valid_from = ring._header[ring._WRITING] - ring.capacity
+
+        if valid_from > start:
+            invalid = min(valid_from - start, len(times))
+            self._overrun(invalid)
+            times = times[invalid:]
+            values = values[invalid:]
+
+        self.cursor = stop
+
+        return ReadingBlock(times, channels, values)
+
+    def _overrun(self, count):
+        self.overruns += int(count)
+        logger.warning("%i readings overwritten before being read", count)
@@ -0,0 +1,225 @@
+"""Push-based access to new datastore readings"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+
+# logger
+logger = logging.getLogger("datalog.subscription")
+
+
+class Subscription(object):
+    """Queue of blocks of readings inserted into a datastore
+
+    Subscriptions are created with :meth:`~datalog.data.DataStore.subscribe`.
+    Each holds a bounded queue of :class:`~datalog.data.ReadingBlock` objects,
+    which can be consumed by blocking iteration, :meth:`get` or asynchronous
+    iteration. When the queue is full, the oldest block is dropped.
+    """
+
+    # default maximum number of queued blocks
+    DEFAULT_QUEUE_SIZE = 100
+
+    def __init__(self, datastore, queue_size=None):
+        """Initialises the subscription
+
+        :param datastore: the datastore subscribed to
+        :type datastore: :class:`~datalog.data.DataStore`
+        :param queue_size: maximum number of blocks to queue
+        :type queue_size: int
+        """
+
+        if queue_size is None:
+            queue_size = self.DEFAULT_QUEUE_SIZE
+
+        queue_size = int(queue_size)
+
+        if queue_size < 1:
+            raise ValueError("Queue size must be at least 1")
+
+        self.datastore = datastore
+        self.queue_size = queue_size
+
+        # time of the last reading taken from the queue
+        self.cursor = None
+
+        # number of readings dropped because the queue was full
+        self.dropped = 0
+
+        # closed flag
+        self.closed = False
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+
+        # futures of asynchronous consumers waiting for blocks
+        self._waiters = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        block = self.get()
+
+        if block is None:
+            raise StopIteration
+
+        return block
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            with self._condition:
+                if self._queue:
+                    return self._take()
+                elif self.closed:
+                    raise StopAsyncIteration
+
+                waiter = (loop, loop.create_future())
+                self._waiters.append(waiter)
+
+            try:
+                await waiter[1]
+            finally:
+                # forget the waiter, e.g. if the consumer was cancelled
+                with self._condition:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def get(self, timeout=None):
+        """Gets the next block of readings, waiting until one is available
+
+        :param timeout: maximum time to wait, in s, or None to wait until a \
+        block is available or the subscription is closed
+        :type timeout: float
+        :return: readings, or None if the timeout expired or the subscription \
+        was closed
+        :rtype: :class:`~datalog.data.ReadingBlock`
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue or self.closed,
+                                     timeout)
+
+            if not self._queue:
+                return None
+
+            return self._take()
+
+    def _take(self):
+        """Takes the next block from the queue and advances the cursor"""
+
+        block = self._queue.popleft()
+        self.cursor = int(block.reading_times[-1])
+
+        return block
+
+    def put(self, block):
+        """Adds the specified block to the queue
+
+        This is called by the datastore when readings are inserted.
+
+        :param block: readings
+        :type block: :class:`~datalog.data.ReadingBlock`
+        """
+
+        with self._condition:
+            if self.closed:
+                return
+
+            if len(self._queue) >= self.queue_size:
+                dropped = self._queue.popleft()
+                self.dropped += len(dropped)
+
+                logger.warning("Subscription queue full; dropped %i readings",
+                               len(dropped))
+
+            self._queue.append(block)
+            self._wake()
+
+    def close(self):
+        """Unsubscribes from the datastore and wakes waiting consumers
+
+        Blocks already queued can still be consumed.
+        """
+
+        self.datastore.unsubscribe(self)
+
+        with self._condition:
+            self.closed = True
+            self._wake()
+
+    def _wake(self):
+        """Wakes waiting consumers; the condition must be held"""
+
+        self._condition.notify_all()
+
+        for loop, future in self._waiters:
+            # a consumer's loop may have closed without it being removed;
+            # it must not stop readings being passed to the others
+            if loop.is_closed():
+                continue
+
+            try:
+                loop.call_soon_threadsafe(self._set_future, future)
+            except RuntimeError:
+                logger.debug("Subscriber event loop closed")
+
+        self._waiters = []
+
+    @staticmethod
+    def _set_future(future):
+        if not future.done():
+            future.set_result(None)
+
+
+class CallbackSubscription(Subscription):
+    """Subscription which calls a function with each block of readings
+
+    The function is called from a dedicated thread, so slow functions do not
+    delay inserts.
+    """
+
+    def __init__(self, datastore, callback, *args, **kwargs):
+        """Initialises the subscription
+
+        :param datastore: the datastore subscribed to
+        :type datastore: :class:`~datalog.data.DataStore`
+        :param callback: function to call with each block of readings
+        :param queue_size: maximum number of blocks to queue
+        :type queue_size: int
+        """
+
+        super(CallbackSubscription, self).__init__(datastore, *args, **kwargs)
+
+        self.callback = callback
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for block in self:
+            try:
+                self.callback(block)
+            except Exception:
+                logger.exception("Subscription callback failed")
+
+    def close(self):
+        """Unsubscribes from the datastore and waits for queued blocks to be \
+        passed to the callback"""
+
+        super(CallbackSubscription, self).close()
+
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
@@ -20,8 +20,6 @@ Sean Leavey
 https://github.com/SeanDS/
 """
 
-import time
-
 from datalog.adc.adc import Adc
 from datalog.adc.config import AdcConfig
 from datalog.data import DataStore
@@ -34,20 +32,10 @@ datastore = DataStore(1000)
 
 # open ADC
 with adc.get_retriever(datastore) as retriever:
-    # default last reading time
-    last_reading = 0
-
-    while(True):
-        # look for new readings
-        new_readings = datastore.get_readings(pivot_time=last_reading)
-
-        if len(new_readings):
+    # subscribe to new readings
+    with datastore.subscribe() as subscription:
+        # wait for each new block of readings
+        for block in subscription:
             # display readings
-            for reading in new_readings:
+            for reading in block.to_readings():
                 print(reading)
-
-            # get the last fetched reading's time
-            last_reading = new_readings[-1].reading_time
-
-        # sleep for 1 second
-        time.sleep(1)
@@ -9,7 +9,8 @@ with open("README.md") as readme_file:
 __version__ = datalog.__version__
 
 requirements = [
-    "appdirs"
+    "appdirs",
+    "numpy>=1.17"
 ]
 
 setup(
@@ -29,6 +30,7 @@ setup(
         "datalog.adc": ['adc.conf.dist']
     },
     install_requires=requirements,
+    python_requires=">=3.8",
     license="GPLv3",
     zip_safe=False,
     classifiers=[
@@ -36,6 +38,6 @@ setup(
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
         "Natural Language :: English",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.5"
+        "Programming Language :: Python :: 3.8"
     ]
 )
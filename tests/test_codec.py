@@ -0,0 +1,111 @@
+"""Reading block codec round trip tests"""
+
+import io
+import unittest
+
+import numpy
+
+from datalog import codec
+from datalog.data import ReadingBlock
+
+
+class TestCodecRoundTrip(unittest.TestCase):
+    """Checks that blocks decode to the blocks that were encoded"""
+
+    def assert_round_trip(self, block):
+        decoded = codec.decode_block(codec.encode_block(block))
+
+        self.assertEqual(decoded.channels, block.channels)
+        numpy.testing.assert_array_equal(decoded.reading_times,
+                                         block.reading_times)
+        # compare bits, so that NaN and signed zeros must match exactly
+        numpy.testing.assert_array_equal(decoded.values.view(numpy.uint64),
+                                         block.values.view(numpy.uint64))
+
+        return decoded
+
+    def test_empty(self):
+        decoded = self.assert_round_trip(ReadingBlock([], [1, 2],
+                                                      numpy.empty((0, 2))))
+        self.assertEqual(len(decoded), 0)
+
+    def test_no_channels(self):
+        self.assert_round_trip(ReadingBlock([1000, 2000], [],
+                                            numpy.empty((2, 0))))
+
+    def test_single_reading(self):
+        self.assert_round_trip(ReadingBlock([1500000000000], [3],
+                                            [[12345.0]]))
+        self.assert_round_trip(ReadingBlock([1500000000000], [3], [[0.125]]))
+
+    def test_integer_values(self):
+        counts = numpy.array([[0, -5], [2 ** 23, 7], [-2 ** 40, 7],
+                              [2 ** 52, -1]], dtype=numpy.float64)
+        block = ReadingBlock([0, 1000, 2000, 3000], [1, 2], counts)
+
+        self.assertEqual(codec.get_encoding(counts[:, 0]),
+                         codec.ENCODING_INTEGER)
+        self.assert_round_trip(block)
+
+    def test_non_integer_values(self):
+        volts = numpy.random.default_rng(0).normal(size=(100, 3))
+        block = ReadingBlock(numpy.arange(100) * 1000, [1, 2, 3], volts)
+
+        self.assertEqual(codec.get_encoding(volts[:, 0]), codec.ENCODING_XOR)
+        self.assert_round_trip(block)
+
+    def test_mixed_channels(self):
+        values = numpy.array([[1.0, 0.5], [2.0, -0.25], [3.0, 1e-300]])
+
+        self.assert_round_trip(ReadingBlock([0, 1, 2], [1, 16], values))
+
+    def test_negative_zero_integer_values(self):
+        values = numpy.array([[-0.0, 1.0], [1.0, 2.0]])
+
+        # integer encoding would decode negative zero as positive zero
+        self.assertEqual(codec.get_encoding(values[:, 0]), codec.ENCODING_XOR)
+        self.assertEqual(codec.get_encoding(values[:, 1]),
+                         codec.ENCODING_INTEGER)
+        self.assert_round_trip(ReadingBlock([0, 1000], [1, 2], values))
+
+    def test_non_finite_values(self):
+        values = numpy.array([[numpy.nan, 1.0], [numpy.inf, -0.0],
+                              [-numpy.inf, 2.0], [1.0, numpy.nan]])
+
+        self.assertEqual(codec.get_encoding(values[:, 0]), codec.ENCODING_XOR)
+        self.assert_round_trip(ReadingBlock([0, 1000, 2000, 3000], [1, 2],
+                                            values))
+
+    def test_negative_deltas(self):
+        # times stepping backwards and irregularly, and decreasing counts
+        times = [5000, 4000, 4500, -1000, 2 ** 62]
+        values = [[100.0], [-100.0], [50.0], [-2 ** 50], [2 ** 50]]
+
+        self.assert_round_trip(ReadingBlock(times, [1], values))
+
+    def test_dump_load(self):
+        block = ReadingBlock(numpy.arange(10) * 60, [1, 2],
+                             numpy.arange(20).reshape(10, 2) / 3)
+
+        fileobj = io.BytesIO()
+        codec.dump(block, fileobj)
+        fileobj.seek(0)
+
+        decoded = codec.load(fileobj)
+
+        numpy.testing.assert_array_equal(decoded.reading_times,
+                                         block.reading_times)
+        numpy.testing.assert_array_equal(decoded.values, block.values)
+        self.assertEqual(decoded.channels, block.channels)
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            codec.decode_block(b"DLX1" + bytes(8))
+
+        with self.assertRaises(ValueError):
+            codec.decode_block(codec.encode_block(
+                ReadingBlock([0], [1], [[1.0]]))[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Disk datastore tests"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from datalog.data import ReadingBlock
+from datalog.disk import DiskDataStore
+
+
+class TestDiskDataStoreSegments(unittest.TestCase):
+    """Checks that segment files survive reopening the datastore"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def insert(self, datastore, start, count):
+        times = 1000 * numpy.arange(start, start + count) + 1500000000000
+        datastore.insert(ReadingBlock(times, [1, 2],
+                                      numpy.full((count, 2), start)))
+
+    def test_deleted_first_segment(self):
+        datastore = DiskDataStore(self.path, segment_size=1000)
+        self.insert(datastore, 0, 4500)
+        datastore.close()
+
+        # free space by deleting the oldest segment
+        os.remove(os.path.join(self.path, "00000000.seg"))
+
+        datastore = DiskDataStore(self.path)
+        self.assertEqual(datastore.num_readings, 3500)
+
+        # insert past the end of the last segment and into new segments
+        self.insert(datastore, 4500, 1600)
+        self.assertEqual(datastore.num_readings, 5100)
+        datastore.close()
+
+        datastore = DiskDataStore(self.path)
+        self.assertEqual(datastore.num_readings, 5100)
+
+        times, _ = datastore.to_numpy()
+        numpy.testing.assert_array_equal(
+            times, 1000 * numpy.arange(1000, 6100) + 1500000000000)
+        datastore.close()
+
+
+if __name__ == "__main__":
+    unittest.main()